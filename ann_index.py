@@ -0,0 +1,185 @@
+# Approximate-nearest-neighbor FAISS index types, per-query search knobs and memory-mapped loading
+import os
+import pickle
+
+# "flat" (exact), "hnsw", "ivf_flat" or "ivf_pq"; chosen whenever an index is saved
+INDEX_TYPE = os.getenv("INDEX_TYPE", "flat")
+INDEX_TYPES = ("flat", "hnsw", "ivf_flat", "ivf_pq")
+# Smaller indexes stay flat: exact search is already fast and needs no training
+ANN_MIN_VECTORS = int(os.getenv("ANN_MIN_VECTORS", "10000"))
+# Most vectors used to train IVF centroids and PQ codebooks
+ANN_TRAIN_SAMPLE = int(os.getenv("ANN_TRAIN_SAMPLE", "50000"))
+HNSW_M = int(os.getenv("HNSW_M", "32"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "200"))
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "64"))
+IVF_NLIST = int(os.getenv("IVF_NLIST", "0"))  # 0 = about 4 * sqrt(vectors)
+IVF_NPROBE = int(os.getenv("IVF_NPROBE", "16"))
+# Edited IVF indexes keep their trained centroids: new vectors are added to them, and they are
+# retrained after this many saved edits (or when the index is compacted). 0 retrains on every save
+IVF_RETRAIN_EVERY = int(os.getenv("IVF_RETRAIN_EVERY", "50"))
+PQ_M = int(os.getenv("PQ_M", "16"))
+PQ_NBITS = 8
+# Load indexes with FAISS memory-mapped IO so worker processes share the OS page cache
+INDEX_MMAP = os.getenv("INDEX_MMAP", "1") == "1"
+
+
+def _metric(vectorstore):
+    import faiss
+    from langchain_community.vectorstores.utils import DistanceStrategy
+
+    if vectorstore.distance_strategy == DistanceStrategy.MAX_INNER_PRODUCT:
+        return faiss.METRIC_INNER_PRODUCT
+    return faiss.METRIC_L2
+
+
+def _flat(dim, metric):
+    import faiss
+
+    return faiss.IndexFlatIP(dim) if metric == faiss.METRIC_INNER_PRODUCT else faiss.IndexFlatL2(dim)
+
+
+def _pq_subquantizers(dim):
+    # PQ needs a sub-quantizer count that divides the dimension
+    for m in range(min(PQ_M, dim), 0, -1):
+        if dim % m == 0:
+            return m
+    return 1
+
+
+def build_ann_index(vectors, index_type, metric):
+    """
+    Builds a FAISS index of index_type over vectors (float32 array, in position
+    order). IVF types are trained on a random sample of at most ANN_TRAIN_SAMPLE.
+    """
+    import faiss
+    import numpy as np
+
+    count, dim = vectors.shape
+    if index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, HNSW_M, metric)
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        index.hnsw.efSearch = HNSW_EF_SEARCH
+    elif index_type in ("ivf_flat", "ivf_pq"):
+        # FAISS wants at least 39 training points per centroid
+        nlist = max(1, min(IVF_NLIST or int(4 * count ** 0.5), count // 39))
+        quantizer = _flat(dim, metric)
+        if index_type == "ivf_flat":
+            index = faiss.IndexIVFFlat(quantizer, dim, nlist, metric)
+        else:
+            index = faiss.IndexIVFPQ(quantizer, dim, nlist, _pq_subquantizers(dim), PQ_NBITS, metric)
+        sample = vectors
+        if count > ANN_TRAIN_SAMPLE:
+            rng = np.random.default_rng(0)
+            sample = vectors[rng.choice(count, ANN_TRAIN_SAMPLE, replace=False)]
+        index.train(sample)
+        index.nprobe = min(IVF_NPROBE, nlist)
+    else:
+        raise ValueError(f"Unknown index type: {index_type} (expected one of {', '.join(INDEX_TYPES)})")
+    index.add(vectors)
+    return index
+
+
+def is_flat(index):
+    import faiss
+
+    return isinstance(index, faiss.IndexFlat)
+
+
+def index_type_of(index):
+    # Inverse of build_ann_index: the INDEX_TYPES name of a FAISS index
+    import faiss
+
+    if isinstance(index, faiss.IndexIVFPQ):
+        return "ivf_pq"
+    if isinstance(index, faiss.IndexIVFFlat):
+        return "ivf_flat"
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    return "flat"
+
+
+def convert_index(vectorstore, index_type=INDEX_TYPE, min_vectors=ANN_MIN_VECTORS, trained=None):
+    """
+    Replaces a flat index with an index_type index over the same vectors, keeping
+    positions (and so index_to_docstore_id) unchanged. Flat indexes smaller than
+    min_vectors are left as they are. With trained, an already trained (possibly
+    emptied) IVF index of index_type, the vectors are added to a copy of it
+    instead of training a new one.
+    """
+    import faiss
+
+    index = vectorstore.index
+    if index_type == "flat" or not is_flat(index) or index.ntotal < min_vectors:
+        return vectorstore
+    vectors = index.reconstruct_n(0, index.ntotal)
+    if index_type == "ivf_pq" and index.ntotal < 2 ** PQ_NBITS:
+        index_type = "ivf_flat"
+    if trained is not None and index_type_of(trained) == index_type and trained.metric_type == index.metric_type:
+        ann = faiss.clone_index(trained)
+        ann.reset()
+        ann.add(vectors)
+        vectorstore.index = ann
+    else:
+        vectorstore.index = build_ann_index(vectors, index_type, _metric(vectorstore))
+    return vectorstore
+
+
+def to_flat(vectorstore, embeddings):
+    """
+    Turns an ANN index back into a flat one so it can be edited (HNSW and IVF
+    cannot remove vectors without leaving gaps in their positions). HNSW and IVF-Flat vectors are reconstructed
+    exactly; IVF-PQ codes are lossy, so those chunks are re-embedded instead,
+    which the embedding cache answers without model calls.
+    """
+    import faiss
+    import numpy as np
+
+    index = vectorstore.index
+    if is_flat(index):
+        return vectorstore
+    positions = range(index.ntotal)
+    if isinstance(index, faiss.IndexIVFPQ):
+        texts = [vectorstore.docstore.search(vectorstore.index_to_docstore_id[p]).page_content for p in positions]
+        vectors = np.array(embeddings.embed_documents(texts), dtype=np.float32)
+    else:
+        if isinstance(index, faiss.IndexIVF):
+            index.make_direct_map()
+        vectors = index.reconstruct_n(0, index.ntotal)
+    flat = _flat(index.d, index.metric_type)
+    flat.add(vectors)
+    vectorstore.index = flat
+    return vectorstore
+
+
+def search_parameters(index, nprobe=None, ef_search=None, selector=None):
+    """
+    Per-query FAISS search parameters for index, or None to use its defaults.
+    Thread-safe, unlike setting index.nprobe on an index shared by requests.
+    With a faiss.IDSelector, only the selected positions can be returned.
+    """
+    import faiss
+
+    if isinstance(index, faiss.IndexIVF) and (nprobe or selector is not None):
+        return faiss.SearchParametersIVF(sel=selector, nprobe=int(nprobe or index.nprobe))
+    if isinstance(index, faiss.IndexHNSW) and (ef_search or selector is not None):
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=int(ef_search or index.hnsw.efSearch))
+    if selector is not None:
+        return faiss.SearchParameters(sel=selector)
+    return None
+
+
+def load_vectorstore(index_path, embeddings, mmap=INDEX_MMAP):
+    """
+    Loads a saved langchain FAISS store. With mmap, IVF inverted lists are mapped
+    from disk instead of read into memory, so processes serving the same index
+    share its pages.
+    """
+    import faiss
+    from langchain_community.vectorstores import FAISS
+
+    if not mmap:
+        return FAISS.load_local(index_path, embeddings, allow_dangerous_deserialization=True)
+    index = faiss.read_index(os.path.join(index_path, "index.faiss"), faiss.IO_FLAG_MMAP)
+    with open(os.path.join(index_path, "index.pkl"), "rb") as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+    return FAISS(embeddings, index, docstore, index_to_docstore_id)
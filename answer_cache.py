@@ -0,0 +1,90 @@
+# Semantic answer cache: reuse answers to near-identical questions over unchanged indexes
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1000"))
+
+
+def _unit(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class SemanticAnswerCache:
+    """
+    Stores (question embedding, searched file_ids + index versions) -> answer.
+    A lookup hits when a cached question over the exact same index versions has
+    cosine similarity >= threshold. Entries expire after ttl seconds and the least
+    recently used are evicted beyond max_entries.
+    """
+
+    def __init__(self, threshold=ANSWER_CACHE_THRESHOLD, ttl=ANSWER_CACHE_TTL, max_entries=ANSWER_CACHE_SIZE):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # entry id -> (scope, unit vector, payload, created)
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evicted = 0
+
+    @staticmethod
+    def scope(file_ids, index_versions):
+        # Any change to an index version produces a different scope, so stale answers never match
+        return (frozenset(file_ids), tuple(sorted(index_versions.items())))
+
+    def lookup(self, query_vector, file_ids, index_versions):
+        scope = self.scope(file_ids, index_versions)
+        query = _unit(query_vector)
+        now = time.time()
+        with self._lock:
+            candidates = []
+            for entry_id, (entry_scope, vector, payload, created) in list(self._entries.items()):
+                if now - created > self.ttl:
+                    del self._entries[entry_id]
+                    self.expired += 1
+                elif entry_scope == scope:
+                    candidates.append((entry_id, vector, payload))
+            if candidates:
+                similarities = np.stack([c[1] for c in candidates]) @ query
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.threshold:
+                    self._entries.move_to_end(candidates[best][0])
+                    self.hits += 1
+                    return dict(candidates[best][2], similarity=float(similarities[best]))
+            self.misses += 1
+            return None
+
+    def store(self, query_vector, file_ids, index_versions, payload):
+        with self._lock:
+            self._entries[self._next_id] = (
+                self.scope(file_ids, index_versions), _unit(query_vector), dict(payload), time.time()
+            )
+            self._next_id += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evicted += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "expired": self.expired,
+                "evicted": self.evicted,
+                "threshold": self.threshold,
+                "ttl": self.ttl,
+                "max_entries": self.max_entries,
+            }
@@ -0,0 +1,93 @@
+# Deterministic benchmark fixtures: the bundled policy PDF plus synthetic files of growing size
+import csv
+import os
+import random
+import shutil
+import sqlite3
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+POLICY_PDF = os.path.join(REPO_ROOT, "For Task - Policy file.pdf")
+
+# Rows/paragraphs/lines per synthetic file; multiplied by the --scale option
+SIZES = {"small": 200, "medium": 2000, "large": 20000}
+
+_WORDS = (
+    "policy member supervisor examiner committee thesis student faculty department "
+    "approval meeting report clause section review external internal research degree "
+    "submission deadline semester credit grade evaluation office registrar"
+).split()
+
+
+def _sentence(rng, words=14):
+    return " ".join(rng.choice(_WORDS) for _ in range(words)).capitalize() + "."
+
+
+def write_txt(path, lines, rng):
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(lines):
+            f.write(f"{i + 1}. {_sentence(rng)}\n")
+
+
+def write_csv(path, rows, rng):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["id", "Period", "department", "note", "amount"])
+        for i in range(rows):
+            writer.writerow([i, f"{2000 + i % 25}.{rng.choice(['03', '06', '09', '12'])}",
+                             rng.choice(_WORDS), _sentence(rng, 8), round(rng.uniform(0, 1e6), 2)])
+
+
+def write_db(path, rows, rng):
+    if os.path.exists(path):
+        os.remove(path)
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE records (id INTEGER, department TEXT, note TEXT, amount REAL)")
+    conn.executemany(
+        "INSERT INTO records VALUES (?, ?, ?, ?)",
+        ((i, rng.choice(_WORDS), _sentence(rng, 8), rng.uniform(0, 1e6)) for i in range(rows)),
+    )
+    conn.commit()
+    conn.close()
+
+
+def write_docx(path, paragraphs, rng):
+    from docx import Document
+
+    doc = Document()
+    for _ in range(paragraphs):
+        doc.add_paragraph(_sentence(rng, 30))
+    doc.save(path)
+
+
+WRITERS = {".txt": write_txt, ".csv": write_csv, ".db": write_db, ".docx": write_docx}
+
+
+def build_fixtures(workdir, scale=1.0, seed=0):
+    """
+    Writes all fixtures into workdir and returns a list of (format, size label, path).
+    The same seed and scale always produce identical files.
+    """
+    os.makedirs(workdir, exist_ok=True)
+    fixtures = []
+    if os.path.exists(POLICY_PDF):
+        pdf_path = os.path.join(workdir, "policy.pdf")
+        shutil.copyfile(POLICY_PDF, pdf_path)
+        fixtures.append((".pdf", "policy", pdf_path))
+    for ext, writer in WRITERS.items():
+        for label, count in SIZES.items():
+            rng = random.Random(f"{seed}:{ext}:{label}")
+            path = os.path.join(workdir, f"synthetic_{label}{ext}")
+            writer(path, max(1, int(count * scale)), rng)
+            fixtures.append((ext, label, path))
+    return fixtures
+
+
+def synthetic_chunks(count, seed=0):
+    rng = random.Random(f"{seed}:chunks")
+    return [" ".join(_sentence(rng) for _ in range(5)) for _ in range(count)]
+
+
+def synthetic_questions(count, seed=0):
+    rng = random.Random(f"{seed}:questions")
+    return [f"What does the policy say about {rng.choice(_WORDS)} and {rng.choice(_WORDS)}? ({i})"
+            for i in range(count)]
@@ -0,0 +1,261 @@
+# Offline benchmark suite for ingestion, indexing and query latency.
+#
+#   python benchmarks/run_benchmarks.py --output bench.json
+#   python benchmarks/run_benchmarks.py --output new.json --compare bench.json
+#
+# Everything runs against deterministic local models (no Gemini calls).
+import argparse
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+# Must be set before any project module is imported: they read these at import time
+os.environ.setdefault("EMBEDDING_BACKEND", "local")
+os.environ.setdefault("LLM_BACKEND", "local")
+# Every benchmark question must reach retrieval and the LLM, so never serve cached answers
+os.environ.setdefault("ANSWER_CACHE_THRESHOLD", "2")
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_ROOT)
+
+from fixtures import build_fixtures, synthetic_chunks, synthetic_questions  # noqa: E402
+
+# Metrics where a larger value is a regression
+LATENCY_SUFFIXES = (".seconds", ".p50", ".p95", ".p99")
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, result
+
+
+def percentile(values, pct):
+    # Nearest-rank percentile
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered), math.ceil(pct / 100 * len(ordered))) - 1)
+    return ordered[rank]
+
+
+def bench_startup(results, repeats=3):
+    # Fresh interpreters, so nothing is already imported; the fastest run is reported
+    for module in ("document_ingestor", "fastapi_app"):
+        runs = []
+        for _ in range(repeats):
+            seconds, _ = timed(lambda: subprocess.run(
+                [sys.executable, "-c", f"import {module}"], cwd=REPO_ROOT, check=True, env=os.environ.copy()
+            ))
+            runs.append(seconds)
+        results[f"startup.import_{module}.seconds"] = min(runs)
+        print(f"import {module}: {min(runs):.3f}s")
+
+
+def bench_extract(fixtures, results):
+    from document_ingestor import DocumentIngestor
+
+    for ext, label, path in fixtures:
+        size_mb = os.path.getsize(path) / 1e6
+        seconds, chunks = timed(lambda: list(DocumentIngestor.extract(path)))
+        key = f"extract{ext}.{label}"
+        results[f"{key}.seconds"] = seconds
+        results[f"{key}.mb_per_s"] = size_mb / seconds if seconds else 0.0
+        results[f"{key}.chunks"] = len(chunks)
+        print(f"{key}: {seconds:.3f}s, {len(chunks)} chunks")
+
+
+def bench_index(sizes, workdir, results):
+    from langchain_community.vectorstores import FAISS
+    from local_models import HashEmbeddings
+
+    embeddings = HashEmbeddings()
+    for n in sizes:
+        texts = synthetic_chunks(n)
+        seconds, store = timed(lambda: FAISS.from_texts(texts, embedding=embeddings))
+        results[f"index.build.{n}.seconds"] = seconds
+        path = os.path.join(workdir, f"index_{n}")
+        store.save_local(path)
+        load_seconds, _ = timed(
+            lambda: FAISS.load_local(path, embeddings, allow_dangerous_deserialization=True)
+        )
+        results[f"index.load.{n}.seconds"] = load_seconds
+        print(f"index {n} chunks: build {seconds:.3f}s, load {load_seconds:.3f}s")
+
+
+# Knob values swept for each ANN index type: (parameter name, values)
+ANN_SWEEPS = {
+    "flat": (None, [None]),
+    "hnsw": ("ef_search", [16, 32, 64, 128, 256]),
+    "ivf_flat": ("nprobe", [1, 4, 16, 64]),
+    "ivf_pq": ("nprobe", [1, 4, 16, 64]),
+}
+
+
+def bench_ann(vector_count, query_count, results, k=10):
+    """
+    Recall@k and per-query latency of every ANN index type against exact flat search.
+    """
+    import faiss
+    import numpy as np
+
+    from ann_index import build_ann_index, search_parameters
+    from local_models import HashEmbeddings
+
+    embeddings = HashEmbeddings()
+    vectors = np.array(embeddings.embed_documents(synthetic_chunks(vector_count)), dtype=np.float32)
+    queries = np.array(embeddings.embed_documents(synthetic_questions(query_count)), dtype=np.float32)
+    exact = faiss.IndexFlatL2(vectors.shape[1])
+    exact.add(vectors)
+    _, truth = exact.search(queries, k)
+    for index_type, (knob, values) in ANN_SWEEPS.items():
+        if index_type == "flat":
+            index = exact
+        else:
+            build_seconds, index = timed(lambda: build_ann_index(vectors, index_type, faiss.METRIC_L2))
+            results[f"ann.{index_type}.build.seconds"] = build_seconds
+        for value in values:
+            params = search_parameters(index, **({knob: value} if knob else {}))
+            latencies, found = [], 0
+            for i in range(len(queries)):
+                query = queries[i:i + 1]
+                if params is None:
+                    seconds, (_, positions) = timed(lambda: index.search(query, k))
+                else:
+                    seconds, (_, positions) = timed(lambda: index.search(query, k, params=params))
+                latencies.append(seconds)
+                found += len(set(positions[0]) & set(truth[i]))
+            key = f"ann.{index_type}" + (f".{knob}_{value}" if knob else "")
+            results[f"{key}.recall"] = found / (k * len(queries))
+            results[f"{key}.p50"] = percentile(latencies, 50)
+            results[f"{key}.p95"] = percentile(latencies, 95)
+            print(f"{key}: recall@{k} {results[key + '.recall']:.3f}, "
+                  f"p50 {results[key + '.p50'] * 1000:.2f}ms, p95 {results[key + '.p95'] * 1000:.2f}ms")
+
+
+def bench_query(index_counts, query_count, chunks_per_index, workdir, results):
+    from fastapi.testclient import TestClient
+    from langchain_community.vectorstores import FAISS
+
+    import fastapi_app
+    from embedding_cache import get_cached_embeddings
+    from index_registry import registry, save_index
+
+    client = TestClient(fastapi_app.app)
+    embeddings = get_cached_embeddings()
+    questions = synthetic_questions(query_count)
+    for count in index_counts:
+        index_dir = os.path.join(workdir, f"indexes_{count}")
+        for i in range(count):
+            texts = synthetic_chunks(chunks_per_index, seed=i)
+            metadatas = [{"filename": f"doc_{i}.txt", "chunk": c, "filetype": ".txt", "file_id": f"doc_{i}"}
+                         for c in range(len(texts))]
+            save_index(FAISS.from_texts(texts, embedding=embeddings, metadatas=metadatas),
+                       os.path.join(index_dir, f"doc_{i}"))
+        fastapi_app.INDEX_DIR = index_dir
+        registry.invalidate()
+        # First query loads every index into the registry; measured separately
+        cold, response = timed(lambda: client.post("/query", json={"question": "warm up"}))
+        response.raise_for_status()
+        latencies = []
+        for question in questions:
+            seconds, response = timed(lambda: client.post("/query", json={"question": question}))
+            response.raise_for_status()
+            latencies.append(seconds)
+        key = f"query.indexes_{count}"
+        results[f"{key}.cold.seconds"] = cold
+        for pct in (50, 95, 99):
+            results[f"{key}.p{pct}"] = percentile(latencies, pct)
+        print(f"{key}: cold {cold:.3f}s, p50 {results[key + '.p50'] * 1000:.1f}ms, "
+              f"p95 {results[key + '.p95'] * 1000:.1f}ms, p99 {results[key + '.p99'] * 1000:.1f}ms")
+
+
+def compare(results, baseline_path, tolerance):
+    """
+    Prints latency metrics that got slower than baseline by more than tolerance.
+    Returns the number of regressions.
+    """
+    with open(baseline_path) as f:
+        baseline = json.load(f)["results"]
+    regressions = 0
+    for key, value in sorted(results.items()):
+        old = baseline.get(key)
+        if not key.endswith(LATENCY_SUFFIXES) or not old:
+            continue
+        ratio = value / old
+        marker = ""
+        if ratio > 1 + tolerance:
+            marker = "  <-- REGRESSION"
+            regressions += 1
+        print(f"{key}: {old:.4f} -> {value:.4f} ({ratio:.2f}x){marker}")
+    return regressions
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, text=True).strip()
+    except Exception:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline ingestion, indexing and query benchmarks.")
+    parser.add_argument("--output", default="bench_results.json", help="JSON file to write results to")
+    parser.add_argument("--compare", help="baseline JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown before flagging (0.2 = 20%%)")
+    parser.add_argument("--workdir", help="directory for fixtures and indexes (default: a temp dir)")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiplier for synthetic fixture sizes")
+    parser.add_argument("--index-counts", default="1,10,100", help="comma-separated index counts for /query")
+    parser.add_argument("--queries", type=int, default=50, help="queries per index count")
+    parser.add_argument("--chunks-per-index", type=int, default=50)
+    parser.add_argument("--build-sizes", default="1000,10000", help="comma-separated chunk counts for index builds")
+    parser.add_argument("--ann-vectors", type=int, default=20000, help="vectors in the ANN recall/latency sweep")
+    parser.add_argument("--skip", default="", help="comma-separated stages to skip: startup,extract,index,ann,query")
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output)
+    baseline = os.path.abspath(args.compare) if args.compare else None
+    workdir = os.path.abspath(args.workdir or tempfile.mkdtemp(prefix="rag-bench-"))
+    os.makedirs(workdir, exist_ok=True)
+    # The app writes uploads/, caches and indexes relative to the working directory
+    os.chdir(workdir)
+    skip = set(filter(None, args.skip.split(",")))
+
+    results = {}
+    if "startup" not in skip:
+        bench_startup(results)
+    if "extract" not in skip:
+        bench_extract(build_fixtures(os.path.join(workdir, "fixtures"), args.scale), results)
+    if "index" not in skip:
+        bench_index([int(n) for n in args.build_sizes.split(",")], workdir, results)
+    if "ann" not in skip:
+        bench_ann(args.ann_vectors, args.queries, results)
+    if "query" not in skip:
+        bench_query([int(n) for n in args.index_counts.split(",")], args.queries,
+                    args.chunks_per_index, workdir, results)
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "git_commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "args": vars(args),
+        },
+        "results": results,
+    }
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {output}")
+    if baseline:
+        regressions = compare(results, baseline, args.tolerance)
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+# Cross-process stress test for the generation-numbered index store (index_store.py).
+#
+#   python benchmarks/stress_index_store.py --writers 4 --readers 4 --rounds 30
+#   python benchmarks/stress_index_store.py --index-type hnsw
+#
+# Writer processes add and delete documents in one shared index through
+# IncrementalIndexManager under the index lock, the way main.py and the corpus
+# index do. Reader processes query it through their own IndexRegistry, like
+# uvicorn workers. Exits with status 1 if a reader saw a torn or inconsistent
+# index, or if the final index is missing any writer's update.
+import argparse
+import multiprocessing
+import os
+import queue
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("EMBEDDING_BACKEND", "local")
+os.environ.setdefault("LLM_BACKEND", "local")
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_ROOT)
+
+CHUNKS_PER_DOC = 5
+# Every DELETE_EVERY-th document a writer adds, it deletes the one it added two rounds earlier
+DELETE_EVERY = 3
+
+
+def document(writer_id, seq):
+    key = f"w{writer_id}-{seq}"
+    texts = [
+        f"{key} chunk {c} " + " ".join(f"term{(writer_id * 31 + seq * 7 + c * 3 + i) % 500}" for i in range(40))
+        for c in range(CHUNKS_PER_DOC)
+    ]
+    metadatas = [{"file_id": key, "chunk": c} for c in range(CHUNKS_PER_DOC)]
+    return key, texts, metadatas
+
+
+def expected_documents(writers, rounds):
+    keys = set()
+    for writer_id in range(writers):
+        for seq in range(rounds):
+            keys.add(f"w{writer_id}-{seq}")
+            if seq % DELETE_EVERY == DELETE_EVERY - 1:
+                keys.discard(f"w{writer_id}-{seq - 2}")
+    return keys
+
+
+def check_consistent(db):
+    """
+    Problems with one loaded generation: FAISS, docstore, ID map and BM25 index
+    must agree, and every document must have all its chunks.
+    """
+    problems = []
+    ntotal = db.index.ntotal
+    if ntotal != len(db.index_to_docstore_id) or ntotal != len(db.docstore._dict):
+        problems.append(f"size mismatch: faiss={ntotal} ids={len(db.index_to_docstore_id)} "
+                        f"docstore={len(db.docstore._dict)}")
+    if db.lexical_index is None or len(db.lexical_index) != ntotal:
+        problems.append(f"bm25 mismatch: {len(db.lexical_index) if db.lexical_index else None} != {ntotal}")
+    chunks = {}
+    for doc_id in db.index_to_docstore_id.values():
+        doc = db.docstore.search(doc_id)
+        chunks[doc.metadata["file_id"]] = chunks.get(doc.metadata["file_id"], 0) + 1
+    partial = [key for key, n in chunks.items() if n != CHUNKS_PER_DOC]
+    if partial:
+        problems.append(f"partial documents: {partial[:3]}")
+    return problems, set(chunks)
+
+
+def writer(index_path, writer_id, rounds, results):
+    from index_manager import IncrementalIndexManager
+    from index_store import index_lock
+    from local_models import HashEmbeddings
+
+    embeddings = HashEmbeddings()
+    start = time.perf_counter()
+    for seq in range(rounds):
+        key, texts, metadatas = document(writer_id, seq)
+        # Held from load to save: the read-modify-write must not interleave with other writers
+        with index_lock(index_path):
+            manager = IncrementalIndexManager(index_path, embeddings)
+            manager.add_document(key, texts, metadatas)
+            if seq % DELETE_EVERY == DELETE_EVERY - 1:
+                manager.delete_document(f"w{writer_id}-{seq - 2}")
+            manager.save()
+    results.put(("writer", writer_id, rounds, time.perf_counter() - start, []))
+
+
+def reader(index_path, reader_id, stop, results):
+    from index_registry import IndexRegistry
+    from local_models import HashEmbeddings
+
+    embeddings = HashEmbeddings()
+    registry = IndexRegistry()
+    query_vector = embeddings.embed_query("term1 term2 term3 chunk")
+    queries = 0
+    failures = []
+    start = time.perf_counter()
+    while not stop.is_set():
+        try:
+            db = registry.get(index_path, embeddings)
+        except FileNotFoundError:
+            # Nothing published yet
+            time.sleep(0.01)
+            continue
+        except Exception as e:
+            failures.append(f"load failed: {e!r}")
+            continue
+        problems, _ = check_consistent(db)
+        try:
+            if len(db.similarity_search_by_vector(query_vector, k=5)) == 0:
+                problems.append("search returned nothing")
+        except Exception as e:
+            problems.append(f"search failed: {e!r}")
+        failures.extend(problems)
+        queries += 1
+    # Every registry miss is a newly published generation picked up without a restart
+    results.put(("reader", reader_id, queries, time.perf_counter() - start, failures[:100], registry.misses))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent cross-process readers and writers on one index.")
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--rounds", type=int, default=30, help="documents added per writer")
+    parser.add_argument("--index-type", default="flat", help="INDEX_TYPE to publish (flat, hnsw, ivf_flat, ivf_pq)")
+    parser.add_argument("--workdir", help="directory for the index (default: a temp dir)")
+    args = parser.parse_args()
+
+    # Inherited by the spawned processes; ANN types only apply above ANN_MIN_VECTORS
+    os.environ["INDEX_TYPE"] = args.index_type
+    os.environ["ANN_MIN_VECTORS"] = "100" if args.index_type != "flat" else os.environ.get("ANN_MIN_VECTORS", "10000")
+    index_path = os.path.join(os.path.abspath(args.workdir or tempfile.mkdtemp(prefix="rag-stress-")), "index")
+
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    stop = context.Event()
+    readers = [context.Process(target=reader, args=(index_path, i, stop, results)) for i in range(args.readers)]
+    writers = [context.Process(target=writer, args=(index_path, i, args.rounds, results)) for i in range(args.writers)]
+    start = time.perf_counter()
+    for process in readers + writers:
+        process.start()
+    for process in writers:
+        process.join()
+    elapsed = time.perf_counter() - start
+    stop.set()
+    reports = []
+    for _ in range(len(readers) + len(writers)):
+        try:
+            reports.append(results.get(timeout=60))
+        except queue.Empty:
+            # A process that crashed never reports; its exit code is checked below
+            break
+    for process in readers:
+        process.join()
+
+    failed = False
+    for process in readers + writers:
+        if process.exitcode != 0:
+            print(f"{process.name} exited with {process.exitcode}")
+            failed = True
+    for report in sorted(reports, key=lambda r: (r[0], r[1])):
+        kind, number, operations, seconds, failures = report[:5]
+        if kind == "writer":
+            print(f"writer {number}: {operations} edits in {seconds:.2f}s")
+        else:
+            print(f"reader {number}: {operations} queries, {report[5]} generations loaded, {len(failures)} failures")
+        for failure in failures[:5]:
+            print(f"  {failure}")
+        failed = failed or bool(failures)
+
+    from index_registry import IndexRegistry
+    from index_store import GENERATION_PREFIX, INDEX_KEEP_GENERATIONS
+    from local_models import HashEmbeddings
+
+    problems, documents = check_consistent(IndexRegistry().get(index_path, HashEmbeddings()))
+    expected = expected_documents(args.writers, args.rounds)
+    if documents != expected:
+        problems.append(f"lost updates: missing {sorted(expected - documents)[:5]}, "
+                        f"unexpected {sorted(documents - expected)[:5]}")
+    leftovers = [name for name in os.listdir(index_path) if name.startswith(("." + GENERATION_PREFIX, GENERATION_PREFIX))]
+    if len(leftovers) > INDEX_KEEP_GENERATIONS:
+        problems.append(f"{len(leftovers)} generation directories left on disk: {sorted(leftovers)[:5]}")
+    total_edits = args.writers * args.rounds
+    print(f"final index: {len(documents)} documents (expected {len(expected)}), "
+          f"{total_edits} edits in {elapsed:.2f}s ({total_edits / elapsed:.1f}/s)")
+    for problem in problems:
+        print(f"  {problem}")
+    sys.exit(1 if failed or problems else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+# Single-pass chunking engine shared by all DocumentIngestor formats
+import os
+import re
+from collections import deque
+
+# "chars" (default) or "tokens": unit used for chunk_size and chunk_overlap
+CHUNK_LENGTH_UNIT = os.getenv("CHUNK_LENGTH_UNIT", "chars")
+
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+
+
+def token_length(text):
+    # Word/punctuation count; close enough to model tokens for sizing chunks
+    return len(_TOKEN_RE.findall(text))
+
+
+def length_function_for(unit=None):
+    unit = unit or CHUNK_LENGTH_UNIT
+    if unit == "tokens":
+        return token_length
+    if unit == "chars":
+        return len
+    raise ValueError(f"Unsupported chunk length unit: {unit}")
+
+
+def iter_chunks(units, chunk_size=1000, chunk_overlap=200, length_function=len, separator="\n"):
+    """
+    Packs an iterable of text units (lines, paragraphs, rows) into chunks of at most
+    chunk_size, lazily and in one pass. Each new chunk starts with the trailing units
+    of the previous one, up to chunk_overlap. A single unit larger than chunk_size
+    becomes a chunk on its own.
+    """
+    sep_len = length_function(separator)
+    buffer = deque()  # (unit, length)
+    size = 0
+    fresh = 0  # units added since the last yielded chunk
+    for unit in units:
+        if not unit or not unit.strip():
+            continue
+        unit_len = length_function(unit)
+        if buffer and size + sep_len + unit_len > chunk_size:
+            if fresh:
+                yield separator.join(u for u, _ in buffer)
+                fresh = 0
+            # Keep only the tail that fits in the overlap and leaves room for this unit
+            while buffer and (size > chunk_overlap or size + sep_len + unit_len > chunk_size):
+                _, removed_len = buffer.popleft()
+                size -= removed_len + (sep_len if buffer else 0)
+        size += unit_len + (sep_len if buffer else 0)
+        buffer.append((unit, unit_len))
+        fresh += 1
+    if fresh:
+        yield separator.join(u for u, _ in buffer)
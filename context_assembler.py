@@ -0,0 +1,143 @@
+# Token-budgeted context assembly: near-duplicate removal, MMR selection and merging of overlapping chunks
+import os
+
+import numpy as np
+from langchain_core.documents import Document
+
+from embedding_scheduler import estimate_tokens
+from instrumentation import count, span
+
+CONTEXT_ASSEMBLY = os.getenv("CONTEXT_ASSEMBLY", "1") == "1"
+# Most (approximate) tokens of retrieved text sent to the LLM per question
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+# 1.0 = pure relevance, 0.0 = pure diversity
+CONTEXT_MMR_LAMBDA = float(os.getenv("CONTEXT_MMR_LAMBDA", "0.7"))
+# Chunks at least this cosine-similar to a better-ranked one are dropped
+CONTEXT_DEDUP_THRESHOLD = float(os.getenv("CONTEXT_DEDUP_THRESHOLD", "0.95"))
+# Shortest shared text between neighbouring chunks that is treated as chunker overlap
+CONTEXT_MIN_OVERLAP = int(os.getenv("CONTEXT_MIN_OVERLAP", "20"))
+
+
+def _unit_rows(vectors):
+    matrix = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _overlap(left, right, min_size=CONTEXT_MIN_OVERLAP):
+    # Length of the longest suffix of left that is also a prefix of right. Shorter than
+    # min_size it is coincidence (e.g. "the" + "external"), so 0. PDF chunks are cut at
+    # raw character offsets, so the overlap may start and end mid-word
+    for size in range(min(len(left), len(right)), max(min_size, 1) - 1, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+
+def _source_key(metadata):
+    return (metadata.get("file_id") or metadata.get("filename"), metadata.get("page"), metadata.get("table"))
+
+
+def merge_adjacent(docs):
+    """
+    Merges chunks that are consecutive (by chunk number) within the same file and
+    page into one document, writing the text they share only once. Merged
+    documents keep the input position of their earliest member.
+    """
+    groups = {}
+    order = []
+    for position, doc in enumerate(docs):
+        groups.setdefault(_source_key(doc.metadata), []).append((position, doc))
+    merged = []
+    for members in groups.values():
+        members.sort(key=lambda item: (item[1].metadata.get("chunk") is None, item[1].metadata.get("chunk") or 0))
+        run = [members[0]]
+        for item in members[1:]:
+            previous = run[-1][1].metadata.get("chunk")
+            current = item[1].metadata.get("chunk")
+            if previous is not None and current is not None and current - previous == 1:
+                run.append(item)
+            else:
+                merged.append(run)
+                run = [item]
+        merged.append(run)
+    for run in merged:
+        text = run[0][1].page_content
+        for _, doc in run[1:]:
+            shared = _overlap(text, doc.page_content)
+            text += doc.page_content[shared:] if shared else "\n" + doc.page_content
+        metadata = dict(run[0][1].metadata)
+        if len(run) > 1:
+            metadata["merged_chunks"] = [doc.metadata.get("chunk") for _, doc in run]
+        order.append((min(position for position, _ in run), Document(page_content=text, metadata=metadata)))
+    order.sort(key=lambda item: item[0])
+    return [doc for _, doc in order]
+
+
+def mmr_order(query_vector, doc_vectors, lambda_mult=CONTEXT_MMR_LAMBDA):
+    """
+    Maximal marginal relevance: indexes of doc_vectors ordered so each next pick
+    is relevant to the query but unlike the ones already picked.
+    """
+    docs = _unit_rows(doc_vectors)
+    relevance = docs @ _unit_rows([query_vector])[0]
+    similarity = docs @ docs.T
+    remaining = list(range(len(docs)))
+    picked = []
+    while remaining:
+        if picked:
+            redundancy = similarity[np.ix_(remaining, picked)].max(axis=1)
+        else:
+            redundancy = np.zeros(len(remaining), dtype=np.float32)
+        scores = lambda_mult * relevance[remaining] - (1 - lambda_mult) * redundancy
+        picked.append(remaining.pop(int(np.argmax(scores))))
+    return picked
+
+
+def assemble_context(docs, query_vector, doc_vectors, token_budget=CONTEXT_TOKEN_BUDGET,
+                     lambda_mult=CONTEXT_MMR_LAMBDA, dedup_threshold=CONTEXT_DEDUP_THRESHOLD):
+    """
+    Turns ranked retrieval hits into the documents to stuff into the prompt:
+    near-duplicates are dropped, the rest are ordered by MMR and added while the
+    merged context fits token_budget (the first one always does).
+    Returns (docs, stats) where stats counts chunks and tokens before and after.
+    """
+    tokens_in = sum(estimate_tokens(doc.page_content) for doc in docs)
+    stats = {"chunks_in": len(docs), "tokens_in": tokens_in}
+    if not docs:
+        return [], dict(stats, chunks_out=0, tokens_out=0, tokens_saved=0, duplicates=0)
+    vectors = _unit_rows(doc_vectors)
+    kept = []
+    for i in range(len(docs)):
+        if not kept or (vectors[kept] @ vectors[i]).max() < dedup_threshold:
+            kept.append(i)
+    selected = []
+    assembled = []
+    for i in mmr_order(query_vector, vectors[kept], lambda_mult):
+        # Passed in MMR order, so merged passages come out best first
+        candidate = merge_adjacent([docs[kept[j]] for j in selected + [i]])
+        if selected and sum(estimate_tokens(doc.page_content) for doc in candidate) > token_budget:
+            continue
+        selected.append(i)
+        assembled = candidate
+    tokens_out = sum(estimate_tokens(doc.page_content) for doc in assembled)
+    return assembled, dict(stats, chunks_out=len(assembled), tokens_out=tokens_out,
+                           tokens_saved=tokens_in - tokens_out, duplicates=len(docs) - len(kept))
+
+
+def assemble_for_query(docs, query_vector, embeddings):
+    """
+    assemble_context() for one retrieval result. Chunk vectors come from
+    embeddings.embed_documents, which the embedding cache answers without model
+    calls. Returns docs unchanged when CONTEXT_ASSEMBLY is off.
+    """
+    if not CONTEXT_ASSEMBLY or not docs:
+        tokens = sum(estimate_tokens(doc.page_content) for doc in docs)
+        return docs, {"chunks_in": len(docs), "tokens_in": tokens, "chunks_out": len(docs),
+                      "tokens_out": tokens, "tokens_saved": 0, "duplicates": 0}
+    with span("query", "assemble"):
+        doc_vectors = embeddings.embed_documents([doc.page_content for doc in docs])
+        assembled, stats = assemble_context(docs, query_vector, doc_vectors)
+    count("rag_context_tokens_saved_total", stats["tokens_saved"])
+    return assembled, stats
@@ -1,115 +1,115 @@
 import os
-import pdfplumber
-from docx import Document
-import pytesseract
-from PIL import Image
-import pandas as pd
-import sqlite3
+
+from chunking import iter_chunks, length_function_for
+
+# File extension -> extractor(file_path, chunk_size, chunk_overlap, length_unit) returning
+# (chunk, page) pairs. Each extractor imports its heavy library on first use, so a
+# process only pays for the formats it actually sees.
+EXTRACTORS = {}
+
+
+def register_extractor(*extensions):
+    def decorator(fn):
+        for ext in extensions:
+            EXTRACTORS[ext] = fn
+        return fn
+    return decorator
+
 
 class DocumentIngestor:
     @staticmethod
     def extract_text_from_pdf_with_pages(file_path, chunk_size=1000, chunk_overlap=200):
-        from pdf_chunk_helper import extract_pdf_chunks_with_page_numbers
-        return extract_pdf_chunks_with_page_numbers(file_path, chunk_size, chunk_overlap)
+        # Generator: pages are extracted in parallel and yielded in page order
+        from pdf_chunk_helper import iter_pdf_chunks_with_page_numbers
+        return iter_pdf_chunks_with_page_numbers(file_path, chunk_size, chunk_overlap)
+
+    @staticmethod
+    def _numbered(chunks):
+        # Text formats have no pages; chunks are numbered from 1 instead
+        return ((chunk, idx + 1) for idx, chunk in enumerate(chunks))
 
     @staticmethod
-    def extract_text_from_docx(file_path, chunk_size=1000, chunk_overlap=200):
+    def extract_text_from_docx(file_path, chunk_size=1000, chunk_overlap=200, length_unit=None):
+        from docx import Document
+
         doc = Document(file_path)
-        paragraphs = [para.text for para in doc.paragraphs if para.text.strip()]
-        # Join paragraphs into chunks
-        chunks = []
-        current = ""
-        for para in paragraphs:
-            if len(current) + len(para) + 1 > chunk_size:
-                if current:
-                    chunks.append(current)
-                current = para
-            else:
-                if current:
-                    current += "\n" + para
-                else:
-                    current = para
-        if current:
-            chunks.append(current)
-        return [(chunk, idx+1) for idx, chunk in enumerate(chunks)]
+        paragraphs = (para.text for para in doc.paragraphs)
+        return DocumentIngestor._numbered(
+            iter_chunks(paragraphs, chunk_size, chunk_overlap, length_function_for(length_unit))
+        )
 
     @staticmethod
-    def extract_text_from_txt(file_path, chunk_size=1000, chunk_overlap=200):
-        with open(file_path, 'r', encoding='utf-8') as f:
-            lines = [line.strip() for line in f if line.strip()]
-        # Join lines into chunks
-        chunks = []
-        current = ""
-        for line in lines:
-            if len(current) + len(line) + 1 > chunk_size:
-                if current:
-                    chunks.append(current)
-                current = line
-            else:
-                if current:
-                    current += "\n" + line
-                else:
-                    current = line
-        if current:
-            chunks.append(current)
-        return [(chunk, idx+1) for idx, chunk in enumerate(chunks)]
+    def extract_text_from_txt(file_path, chunk_size=1000, chunk_overlap=200, length_unit=None):
+        # Lines are read lazily so large files are chunked in constant memory
+        def lines():
+            with open(file_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    yield line.strip()
+        return DocumentIngestor._numbered(
+            iter_chunks(lines(), chunk_size, chunk_overlap, length_function_for(length_unit))
+        )
 
     @staticmethod
     def extract_text_from_image(file_path):
-        image = Image.open(file_path)
-        return pytesseract.image_to_string(image)
+        # Preprocessed OCR in the worker pool; repeated images are served from the OCR cache
+        from ocr import ocr_image_file
+        return ocr_image_file(file_path)
 
     @staticmethod
-    def extract_text_from_csv(file_path, chunk_size=1000, chunk_overlap=200):
-        df = pd.read_csv(file_path)
-        lines = df.to_string(index=False).splitlines()
-        # Join lines into chunks
-        chunks = []
-        current = ""
-        for line in lines:
-            if len(current) + len(line) + 1 > chunk_size:
-                if current:
-                    chunks.append(current)
-                current = line
-            else:
-                if current:
-                    current += "\n" + line
-                else:
-                    current = line
-        if current:
-            chunks.append(current)
-        return [(chunk, idx+1) for idx, chunk in enumerate(chunks)]
+    def extract_text_from_csv(file_path, chunk_size=1000, chunk_overlap=200, length_unit=None):
+        # Rows are streamed and grouped into chunks that each repeat the header line
+        from structured_ingest import iter_csv_row_groups
+
+        groups = iter_csv_row_groups(file_path, chunk_size, chunk_overlap, length_function_for(length_unit))
+        return ((text, idx + 1) for idx, (text, _) in enumerate(groups))
 
     @staticmethod
-    def extract_text_from_db(file_path):
-        conn = sqlite3.connect(file_path)
-        cursor = conn.cursor()
-        text = ""
-        for table in cursor.execute("SELECT name FROM sqlite_master WHERE type='table';").fetchall():
-            table_name = table[0]
-            rows = cursor.execute(f"SELECT * FROM {table_name}").fetchall()
-            text += f"Table: {table_name}\n"
-            for row in rows:
-                text += str(row) + "\n"
-        conn.close()
-        return text
+    def extract_text_from_db(file_path, chunk_size=1000, chunk_overlap=200, length_unit=None, progress=None):
+        # Each table is streamed with fetchmany into size-bounded row groups
+        from structured_ingest import iter_db_row_groups
+
+        groups = iter_db_row_groups(file_path, chunk_size, chunk_overlap, length_function_for(length_unit),
+                                    progress=progress)
+        return ((text, idx + 1) for idx, (text, _) in enumerate(groups))
 
     @staticmethod
-    def extract(file_path, chunk_size=1000, chunk_overlap=200):
+    def extract_with_metadata(file_path, chunk_size=1000, chunk_overlap=200, length_unit=None, progress=None):
+        """
+        Like extract(), but yields (chunk, page, metadata) triples. CSV and DB chunks
+        carry table/column/row-range metadata; other formats yield empty metadata.
+        """
+        from structured_ingest import iter_csv_row_groups, iter_db_row_groups
+
         ext = os.path.splitext(file_path)[1].lower()
-        if ext == '.pdf':
-            return DocumentIngestor.extract_text_from_pdf_with_pages(file_path, chunk_size, chunk_overlap)
-        elif ext == '.docx':
-            return DocumentIngestor.extract_text_from_docx(file_path, chunk_size, chunk_overlap)
-        elif ext == '.txt':
-            return DocumentIngestor.extract_text_from_txt(file_path, chunk_size, chunk_overlap)
-        elif ext in ['.jpg', '.jpeg', '.png']:
-            text = DocumentIngestor.extract_text_from_image(file_path)
-            return [(text, 1)]
-        elif ext == '.csv':
-            return DocumentIngestor.extract_text_from_csv(file_path, chunk_size, chunk_overlap)
+        if ext == '.csv':
+            groups = iter_csv_row_groups(file_path, chunk_size, chunk_overlap, length_function_for(length_unit),
+                                         progress=progress)
         elif ext == '.db':
-            text = DocumentIngestor.extract_text_from_db(file_path)
-            return [(text, 1)]
+            groups = iter_db_row_groups(file_path, chunk_size, chunk_overlap, length_function_for(length_unit),
+                                        progress=progress)
         else:
+            for chunk, page in DocumentIngestor.extract(file_path, chunk_size, chunk_overlap, length_unit):
+                yield chunk, page, {}
+            return
+        for idx, (text, metadata) in enumerate(groups):
+            yield text, idx + 1, metadata
+
+    @staticmethod
+    def extract(file_path, chunk_size=1000, chunk_overlap=200, length_unit=None):
+        ext = os.path.splitext(file_path)[1].lower()
+        extractor = EXTRACTORS.get(ext)
+        if extractor is None:
             raise ValueError(f"Unsupported file type: {ext}")
+        return extractor(file_path, chunk_size, chunk_overlap, length_unit)
+
+
+register_extractor('.pdf')(
+    lambda path, size, overlap, unit: DocumentIngestor.extract_text_from_pdf_with_pages(path, size, overlap)
+)
+register_extractor('.docx')(DocumentIngestor.extract_text_from_docx)
+register_extractor('.txt')(DocumentIngestor.extract_text_from_txt)
+register_extractor('.jpg', '.jpeg', '.png')(
+    lambda path, size, overlap, unit: [(DocumentIngestor.extract_text_from_image(path), 1)]
+)
+register_extractor('.csv')(DocumentIngestor.extract_text_from_csv)
+register_extractor('.db')(DocumentIngestor.extract_text_from_db)
@@ -0,0 +1,166 @@
+# Persistent, content-addressed cache for chunk and query embeddings
+import hashlib
+import os
+import sqlite3
+import threading
+from array import array
+from collections import OrderedDict
+
+from langchain_core.embeddings import Embeddings
+
+from model_providers import get_embedding_client
+
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "embedding_cache.sqlite3")
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "1024"))
+
+
+def normalize_text(text):
+    # Whitespace-only differences should not cost a new embedding call
+    return " ".join(text.split())
+
+
+def text_hash(text):
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+def _model_name(embeddings):
+    return getattr(embeddings, "model", None) or type(embeddings).__name__
+
+
+class EmbeddingStore:
+    """
+    SQLite table of float32 vectors keyed by (model name, hash of normalized text).
+    """
+
+    def __init__(self, path=EMBEDDING_CACHE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "model TEXT NOT NULL, text_hash TEXT NOT NULL, vector BLOB NOT NULL, "
+            "PRIMARY KEY (model, text_hash))"
+        )
+        self._conn.commit()
+
+    def get_many(self, model, hashes):
+        found = {}
+        unique = list(dict.fromkeys(hashes))
+        with self._lock:
+            # Stay well under SQLite's bound-parameter limit
+            for start in range(0, len(unique), 500):
+                batch = unique[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                    [model, *batch],
+                ).fetchall()
+                for h, blob in rows:
+                    vector = array("f")
+                    vector.frombytes(blob)
+                    found[h] = vector.tolist()
+        return found
+
+    def put_many(self, model, items):
+        rows = [(model, h, array("f", vector).tobytes()) for h, vector in items]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, vector) VALUES (?, ?, ?)", rows
+            )
+            self._conn.commit()
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Wraps an embedding model so index builds only embed chunks that are not cached
+    yet, and repeated questions are served from an in-memory LRU.
+    """
+
+    def __init__(self, underlying, store=None, query_cache_size=QUERY_CACHE_SIZE):
+        self.underlying = underlying
+        self.model = _model_name(underlying)
+        self.store = store or EmbeddingStore()
+        self.query_cache_size = query_cache_size
+        self._query_cache = OrderedDict()
+        self._query_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def embed_documents(self, texts):
+        hashes = [text_hash(t) for t in texts]
+        cached = self.store.get_many(self.model, hashes)
+        missing = {}
+        for h, text in zip(hashes, texts):
+            if h not in cached and h not in missing:
+                missing[h] = text
+        self.hits += len(texts) - len(missing)
+        self.misses += len(missing)
+        if missing:
+            vectors = self.underlying.embed_documents(list(missing.values()))
+            new_items = list(zip(missing.keys(), vectors))
+            self.store.put_many(self.model, new_items)
+            cached.update(new_items)
+        return [cached[h] for h in hashes]
+
+    def embed_queries(self, texts):
+        """
+        Embeds many questions with one batched model call for the ones not in the LRU.
+        """
+        keys = [text_hash(t) for t in texts]
+        vectors = {}
+        with self._query_lock:
+            for key in keys:
+                if key in self._query_cache:
+                    self._query_cache.move_to_end(key)
+                    vectors[key] = self._query_cache[key]
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in vectors and key not in missing:
+                missing[key] = text
+        self.hits += len(texts) - len(missing)
+        self.misses += len(missing)
+        if missing:
+            try:
+                # Gemini embeds queries and documents differently; other models ignore this
+                new_vectors = self.underlying.embed_documents(list(missing.values()), task_type="retrieval_query")
+            except TypeError:
+                new_vectors = self.underlying.embed_documents(list(missing.values()))
+            with self._query_lock:
+                for key, vector in zip(missing, new_vectors):
+                    vectors[key] = vector
+                    self._query_cache[key] = vector
+                while len(self._query_cache) > self.query_cache_size:
+                    self._query_cache.popitem(last=False)
+        return [vectors[key] for key in keys]
+
+    def embed_query(self, text):
+        key = text_hash(text)
+        with self._query_lock:
+            vector = self._query_cache.get(key)
+            if vector is not None:
+                self._query_cache.move_to_end(key)
+                self.hits += 1
+                return vector
+        self.misses += 1
+        vector = self.underlying.embed_query(text)
+        with self._query_lock:
+            self._query_cache[key] = vector
+            while len(self._query_cache) > self.query_cache_size:
+                self._query_cache.popitem(last=False)
+        return vector
+
+
+_shared = {}
+_shared_lock = threading.Lock()
+
+
+def get_cached_embeddings(model="models/embedding-001"):
+    """
+    Returns the process-wide cached embedding client for model.
+    """
+    with _shared_lock:
+        if model not in _shared:
+            # Pooled client with timeouts, retries and a circuit breaker (model_providers.py)
+            _shared[model] = CachedEmbeddings(get_embedding_client(model))
+        return _shared[model]
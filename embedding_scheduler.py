@@ -0,0 +1,175 @@
+# Batched, rate-limited embedding pipeline that streams vectors into a FAISS index
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+
+from langchain_community.vectorstores import FAISS
+
+from model_providers import NON_RETRYABLE, ResilientEmbeddings
+
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "100"))
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "4"))
+# 0 disables the corresponding limit
+EMBED_REQUESTS_PER_MINUTE = int(os.getenv("EMBED_REQUESTS_PER_MINUTE", "0"))
+EMBED_TOKENS_PER_MINUTE = int(os.getenv("EMBED_TOKENS_PER_MINUTE", "0"))
+# Only used for clients without their own retries (model_providers clients retry behind a circuit breaker)
+EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", "5"))
+
+
+def _retries_itself(embeddings):
+    # Looks through wrappers such as embedding_cache.CachedEmbeddings
+    while embeddings is not None:
+        if isinstance(embeddings, ResilientEmbeddings):
+            return True
+        embeddings = getattr(embeddings, "underlying", None)
+    return False
+
+
+def estimate_tokens(text):
+    # Rough count used for quota accounting (~4 characters per token)
+    return len(text) // 4 + 1
+
+
+class RateLimiter:
+    """
+    Sliding one-minute window over requests and tokens. acquire() blocks until
+    sending one more request of the given size stays within both budgets.
+    """
+
+    def __init__(self, requests_per_minute=0, tokens_per_minute=0, window=60.0):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.window = window
+        self._events = deque()  # (timestamp, tokens)
+        self._tokens_in_window = 0
+        self._lock = threading.Lock()
+
+    def _expire(self, now):
+        while self._events and now - self._events[0][0] >= self.window:
+            _, tokens = self._events.popleft()
+            self._tokens_in_window -= tokens
+
+    def acquire(self, tokens):
+        if not self.requests_per_minute and not self.tokens_per_minute:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._expire(now)
+                requests_ok = not self.requests_per_minute or len(self._events) < self.requests_per_minute
+                # An oversized batch is let through on an empty window rather than blocking forever
+                tokens_ok = (
+                    not self.tokens_per_minute
+                    or not self._events
+                    or self._tokens_in_window + tokens <= self.tokens_per_minute
+                )
+                if requests_ok and tokens_ok:
+                    self._events.append((now, tokens))
+                    self._tokens_in_window += tokens
+                    return
+                wait_for = self.window - (now - self._events[0][0])
+            time.sleep(max(wait_for, 0.01))
+
+
+class EmbeddingScheduler:
+    """
+    Splits texts into batches and embeds them with bounded concurrency, within
+    the rate limits. Failed batches are retried with jittered exponential backoff
+    unless the client already retries them itself.
+    Works with any LangChain Embeddings (Gemini, cached, or local_models.HashEmbeddings).
+    """
+
+    def __init__(
+        self,
+        embeddings,
+        batch_size=EMBED_BATCH_SIZE,
+        max_concurrency=EMBED_CONCURRENCY,
+        requests_per_minute=EMBED_REQUESTS_PER_MINUTE,
+        tokens_per_minute=EMBED_TOKENS_PER_MINUTE,
+        max_retries=None,
+        backoff_base=1.0,
+        backoff_max=30.0,
+    ):
+        self.embeddings = embeddings
+        self.batch_size = max(1, batch_size)
+        self.max_concurrency = max(1, max_concurrency)
+        self.rate_limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+        if max_retries is None:
+            max_retries = 0 if _retries_itself(embeddings) else EMBED_MAX_RETRIES
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+    def _embed_batch(self, texts):
+        tokens = sum(estimate_tokens(t) for t in texts)
+        attempt = 0
+        while True:
+            self.rate_limiter.acquire(tokens)
+            try:
+                return self.embeddings.embed_documents(texts)
+            except NON_RETRYABLE:
+                # Includes CircuitOpenError: the provider is known to be down, waiting here does not help
+                raise
+            except Exception:
+                attempt += 1
+                if attempt > self.max_retries:
+                    raise
+                delay = min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1))
+                time.sleep(delay * random.uniform(0.5, 1.0))
+
+    def iter_batches(self, texts, metadatas=None, ids=None):
+        """
+        Yields (texts, vectors, metadatas, ids) for each batch as soon as it is embedded.
+        Batches finish in any order; at most max_concurrency are in flight.
+        """
+        if metadatas is None:
+            metadatas = [{} for _ in texts]
+        if ids is None:
+            ids = [None] * len(texts)
+        batches = (
+            (texts[i:i + self.batch_size], metadatas[i:i + self.batch_size], ids[i:i + self.batch_size])
+            for i in range(0, len(texts), self.batch_size)
+        )
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as pool:
+            pending = {}
+            for batch in batches:
+                pending[pool.submit(self._embed_batch, batch[0])] = batch
+                if len(pending) >= self.max_concurrency:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        batch_texts, batch_metas, batch_ids = pending.pop(future)
+                        yield batch_texts, future.result(), batch_metas, batch_ids
+            for future in as_completed(list(pending)):
+                batch_texts, batch_metas, batch_ids = pending.pop(future)
+                yield batch_texts, future.result(), batch_metas, batch_ids
+
+    def build_index(self, texts, metadatas=None, vectorstore=None, progress=None, ids=None):
+        """
+        Embeds texts and adds each finished batch to vectorstore (a new FAISS
+        index if None). progress(done, total) is called after every batch.
+        """
+        done = 0
+        for batch_texts, vectors, batch_metas, batch_ids in self.iter_batches(texts, metadatas, ids):
+            pairs = list(zip(batch_texts, vectors))
+            # FAISS generates uuids when no ids are given
+            batch_ids = batch_ids if None not in batch_ids else None
+            if vectorstore is None:
+                vectorstore = FAISS.from_embeddings(pairs, self.embeddings, metadatas=batch_metas, ids=batch_ids)
+            else:
+                vectorstore.add_embeddings(pairs, metadatas=batch_metas, ids=batch_ids)
+            done += len(batch_texts)
+            if progress:
+                progress(done, len(texts))
+        return vectorstore
+
+
+def build_index(texts, embeddings, metadatas=None, progress=None):
+    """
+    Drop-in replacement for FAISS.from_texts using the configured scheduler settings.
+    """
+    if not texts:
+        raise ValueError("No texts to embed.")
+    return EmbeddingScheduler(embeddings).build_index(texts, metadatas, progress=progress)
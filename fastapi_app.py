@@ -1,16 +1,39 @@
-from fastapi import FastAPI, File, UploadFile, Form, HTTPException, Request
-from fastapi.responses import JSONResponse
+import time
+_import_start = time.perf_counter()
+import threading
+from fastapi import BackgroundTasks, FastAPI, File, UploadFile, Form, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 import os
-import shutil
+import asyncio
 import base64
-from document_ingestor import DocumentIngestor
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
+import json
+from answer_cache import SemanticAnswerCache
+from ocr import ocr_image_bytes
+from context_assembler import assemble_for_query
+from upload_catalog import UploadCatalog, UploadTooLargeError, is_file_id, save_upload
+from embedding_scheduler import estimate_tokens
+from instrumentation import count, log_event, observe, render_prometheus, span, start_request
+from embedding_cache import get_cached_embeddings
+from model_providers import breaker_states
+from ingestion_jobs import IngestionJobManager, QueueFullError
+from starlette.concurrency import run_in_threadpool
 
-from langchain_community.vectorstores import FAISS
-from langchain.text_splitter import CharacterTextSplitter
-from main import get_conversational_chain
+from rag_core import get_conversational_chain
+from session_store import get_session_store, prepare_turn, record_turn
+from index_registry import get_index, index_version, registry
+from index_store import published_at, retire
+from multi_index_search import (
+    CORPUS_INDEX,
+    MERGED_CORPUS_INDEX,
+    list_file_ids,
+    remove_from_corpus,
+    batch_search_corpus,
+    batch_search_indexes,
+    search_corpus,
+    search_indexes,
+)
 from typing import List
 
 
@@ -30,114 +53,470 @@ def root():
     return {"message": "Welcome to the RAG API! Use /docs for API documentation."}
 UPLOAD_DIR = "uploads"
 INDEX_DIR = "faiss_index"
+# Concurrent LLM calls per /query/batch request, and the largest batch accepted
+BATCH_LLM_CONCURRENCY = int(os.getenv("BATCH_LLM_CONCURRENCY", "8"))
+BATCH_MAX_QUESTIONS = int(os.getenv("BATCH_MAX_QUESTIONS", "100"))
+# Indexes to load into the registry at startup, most recently written first (0 = none)
+WARMUP_INDEXES = int(os.getenv("WARMUP_INDEXES", "0"))
 
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
+ingestion_jobs = IngestionJobManager(INDEX_DIR)
+answer_cache = SemanticAnswerCache()
+upload_catalog = UploadCatalog(os.path.join(INDEX_DIR, "catalog.json"))
+
 
 class QueryRequest(BaseModel):
     question: str
     image_base64: str = None
     file_id: str = None  # can be comma-separated for multi-doc
+    debug_timing: bool = False  # include a per-stage timing breakdown in the response
+    nprobe: int = None  # IVF indexes: clusters to visit (higher = better recall, slower)
+    ef_search: int = None  # HNSW indexes: search breadth (higher = better recall, slower)
+    session_id: str = None  # continue a server-side conversation (history, summary, question rewriting)
+
+
+class BatchQueryRequest(BaseModel):
+    questions: List[str]
+    file_id: str = None  # can be comma-separated for multi-doc
+    max_concurrency: int = None  # defaults to BATCH_LLM_CONCURRENCY
+    nprobe: int = None
+    ef_search: int = None
 
-@app.post("/upload")
+@app.post("/upload", status_code=202)
 async def upload_file(file: UploadFile = File(...)):
     if not file:
         raise HTTPException(status_code=400, detail="No file uploaded.")
-    file_path = os.path.join(UPLOAD_DIR, file.filename)
+    ext = os.path.splitext(file.filename)[1].lower()
     try:
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        # Extract text
-        raw_text = DocumentIngestor.extract(file_path)
-        if not raw_text or not raw_text.strip():
-            raise HTTPException(status_code=400, detail="No extractable text found in file.")
-        # Chunk text
-        text_splitter = CharacterTextSplitter(separator="\n", chunk_size=1000, chunk_overlap=200, length_function=len)
-        text_chunks = text_splitter.split_text(raw_text)
-        if not text_chunks:
-            raise HTTPException(status_code=400, detail="No text chunks generated from file.")
-        # Prepare metadatas for each chunk
-        ext = os.path.splitext(file.filename)[1].lower()
-        metadatas = [
-            {"filename": file.filename, "chunk": i, "filetype": ext}
-            for i in range(len(text_chunks))
-        ]
-        # Embeddings and vector store
-        embeddings = GoogleGenerativeAIEmbeddings(model="models/embedding-001")
-        vectorstore = FAISS.from_texts(text_chunks, embedding=embeddings, metadatas=metadatas)
-        # Save index with file_id
-        file_id = os.path.splitext(file.filename)[0]
-        index_path = os.path.join(INDEX_DIR, file_id)
-        os.makedirs(index_path, exist_ok=True)
-        vectorstore.save_local(index_path)
-        # Optionally, clean up uploaded file to save space
-        try:
-            os.remove(file_path)
-        except Exception:
-            pass
-        return {"file_id": file_id, "filename": file.filename, "filetype": ext, "icon": filetype_icon(ext)}
+        # Stream to a unique temp file while hashing, so same-name uploads never collide
+        copy_start = time.perf_counter()
+        file_path, digest, size = await save_upload(file, UPLOAD_DIR)
+        copy_seconds = time.perf_counter() - copy_start
+        observe("upload", "copy", copy_seconds)
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to process file: {str(e)}")
+    # file_id is derived from the content, so identical files share one index.
+    # The catalog update waits on a file lock, so it runs off the event loop
+    file_id = await run_in_threadpool(upload_catalog.register, file.filename, digest, size)
+    result = {
+        "file_id": file_id,
+        "filename": file.filename,
+        "filetype": ext,
+        "icon": filetype_icon(ext),
+        "sha256": digest,
+    }
+    job = ingestion_jobs.active_job(file_id)
+    if job is None and index_version(os.path.join(INDEX_DIR, file_id)) is not None:
+        # Already indexed: skip extraction and embedding entirely
+        job = {"job_id": None, "status": "done", "duplicate": True}
+    if job is not None:
+        os.remove(file_path)
+        count("rag_uploads_deduplicated_total")
+        return {**result, "job_id": job["job_id"], "status": job["status"], "duplicate": True}
+    try:
+        # Extraction, embedding and index writing continue in the background
+        job = ingestion_jobs.submit(file_path, file.filename, file_id, timings={"copy": copy_seconds})
+    except QueueFullError as e:
+        os.remove(file_path)
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "5"})
+    return {**result, "job_id": job["job_id"], "status": job["status"], "duplicate": False}
 
-@app.post("/query")
-async def query_api(request: QueryRequest):
+@app.get("/documents")
+def list_documents():
+    return {"documents": upload_catalog.entries()}
+
+@app.get("/jobs/{job_id}")
+def job_status(job_id: str):
+    job = ingestion_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return job
+
+@app.delete("/documents/{file_id}")
+def delete_document(file_id: str):
+    index_path = os.path.join(INDEX_DIR, file_id)
+    if not is_file_id(file_id) or index_version(index_path) is None:
+        raise HTTPException(status_code=404, detail="Document not found.")
+    # Other workers stop serving it on their next manifest check
+    retire(index_path)
+    registry.invalidate(index_path)
+    removed = remove_from_corpus(file_id, INDEX_DIR, get_cached_embeddings())
+    upload_catalog.remove(file_id)
+    return {"file_id": file_id, "deleted": True, "corpus_chunks_removed": removed}
+
+def resolve_indexes(request: QueryRequest):
+    """
+    Returns (file_ids, index_paths, use_corpus) for the documents a query should search.
+    """
     # Validate input
     if not request.question or not request.question.strip():
         raise HTTPException(status_code=400, detail="Question is required.")
-    context = ""
-    metadatas = []
-    docs = []
-    embeddings = GoogleGenerativeAIEmbeddings(model="models/embedding-001")
+    return select_indexes(request.file_id)
+
+def select_indexes(file_id):
+    """
+    Returns (file_ids, index_paths, use_corpus) for a comma-separated file_id (None = all).
+    """
     # Multi-document support: file_id can be comma-separated or None (search all)
     file_ids = []
-    if request.file_id:
-        file_ids = [fid.strip() for fid in request.file_id.split(",") if fid.strip()]
-    else:
+    if file_id:
+        file_ids = [fid.strip() for fid in file_id.split(",") if fid.strip()]
+        invalid = [fid for fid in file_ids if not is_file_id(fid)]
+        if invalid:
+            raise HTTPException(status_code=400, detail=f"Invalid file_id: {invalid[0]}")
+    if not file_ids:
         # If no file_id, search all indexes
-        file_ids = [d for d in os.listdir(INDEX_DIR) if os.path.isdir(os.path.join(INDEX_DIR, d))]
+        file_ids = list_file_ids(INDEX_DIR)
+    # Every uploaded file has its own index, so it decides which file_ids exist
+    file_ids = [fid for fid in file_ids if index_version(os.path.join(INDEX_DIR, fid)) is not None]
     if not file_ids:
         raise HTTPException(status_code=404, detail="No documents found to search.")
+    index_paths = [os.path.join(INDEX_DIR, fid) for fid in file_ids]
+    corpus_path = os.path.join(INDEX_DIR, CORPUS_INDEX)
+    if MERGED_CORPUS_INDEX and index_version(corpus_path) is not None:
+        # The corpus version is part of the answer cache key too
+        return file_ids, index_paths + [corpus_path], True
+    return file_ids, index_paths, False
+
+def retrieve_context(request: QueryRequest, query_vector=None):
+    """
+    Searches the requested indexes, assembles the hits into a token-budgeted
+    context and OCRs the optional image.
+    Returns (docs, context, metadatas, context_stats).
+    """
+    file_ids, index_paths, use_corpus = resolve_indexes(request)
+    context = ""
+    embeddings = get_cached_embeddings()
     # Limit number of docs per query for performance
     max_chunks = 10
-    for fid in file_ids:
-        index_path = os.path.join(INDEX_DIR, fid)
-        if not os.path.exists(index_path):
-            continue
-        try:
-            db = FAISS.load_local(index_path, embeddings, allow_dangerous_deserialization=True)
-            docs.extend(db.similarity_search(request.question, k=max_chunks))
-        except Exception as e:
-            continue
+    if use_corpus:
+        # One search over the merged corpus, restricted to the requested files
+        hits = search_corpus(request.question, INDEX_DIR, embeddings, file_ids=file_ids, k=max_chunks,
+                             query_vector=query_vector, nprobe=request.nprobe, ef_search=request.ef_search)
+    else:
+        # Question is embedded once; indexes are searched in parallel and merged by score
+        hits = search_indexes(request.question, index_paths, embeddings, k=max_chunks, query_vector=query_vector,
+                              nprobe=request.nprobe, ef_search=request.ef_search)
+    if query_vector is None:
+        query_vector = embeddings.embed_query(request.question)
+    # Merge overlapping chunks, drop near-duplicates and keep the MMR best within the token budget
+    docs, context_stats = assemble_for_query([doc for doc, _ in hits], query_vector, embeddings)
     # If image is provided, extract text using OCR
     if request.image_base64:
         try:
-            from PIL import Image
-            import io
-            import pytesseract
             image_data = base64.b64decode(request.image_base64)
-            image = Image.open(io.BytesIO(image_data))
-            context += pytesseract.image_to_string(image)
+            # Tesseract runs in the OCR worker pool; repeated screenshots hit the OCR cache
+            with span("query", "ocr"):
+                context += ocr_image_bytes(image_data)
         except Exception as e:
             raise HTTPException(status_code=400, detail=f"Failed to process image: {str(e)}")
-    # Add context from docs and collect metadata (limit to max_chunks)
-    docs = docs[:max_chunks]
+    # Add context from docs and collect metadata
     context += "\n".join([doc.page_content for doc in docs])
-    metadatas = [doc.metadata for doc in docs]
+    return docs, context, describe_sources(docs), context_stats
+
+def describe_sources(docs):
+    # Copy metadata: docs are shared with the cached index
+    metadatas = [dict(doc.metadata) for doc in docs]
+    # Add icon and filetype to each metadata
+    for m in metadatas:
+        m["icon"] = filetype_icon(m.get("filetype", ""))
+    return metadatas
+
+def retrieve_batch(request: BatchQueryRequest):
+    """
+    Embeds all questions in one call and searches each index once for the whole batch.
+    Returns one (docs, context, metadatas, context_stats, cache_key, cached) tuple per question.
+    """
+    file_ids, index_paths, use_corpus = select_indexes(request.file_id)
+    versions = {os.path.basename(p): index_version(p) for p in index_paths}
+    embeddings = get_cached_embeddings()
+    max_chunks = 10
+    with span("query", "embed"):
+        query_vectors = embeddings.embed_queries(request.questions)
+    if use_corpus:
+        hits = batch_search_corpus(query_vectors, INDEX_DIR, embeddings, file_ids, k=max_chunks,
+                                   nprobe=request.nprobe, ef_search=request.ef_search, questions=request.questions)
+    else:
+        hits = batch_search_indexes(query_vectors, index_paths, embeddings, k=max_chunks,
+                                    nprobe=request.nprobe, ef_search=request.ef_search, questions=request.questions)
+    results = []
+    for vector, question_hits in zip(query_vectors, hits):
+        cache_key = (vector, file_ids, versions)
+        cached = answer_cache.lookup(*cache_key)
+        count("rag_answer_cache_lookups_total", result="hit" if cached is not None else "miss")
+        docs, context_stats = [], None
+        if cached is None:
+            docs, context_stats = assemble_for_query([doc for doc, _ in question_hits], vector, embeddings)
+        context = "\n".join(doc.page_content for doc in docs)
+        results.append((docs, context, describe_sources(docs), context_stats, cache_key, cached))
+    return results
+
+def cached_answer(request: QueryRequest):
+    """
+    Embeds the question and looks it up in the semantic answer cache.
+    Returns (cache_key, cached_payload); cache_key is None when caching does not apply.
+    """
+    if request.image_base64:
+        # Answers to image questions depend on the image, not only the question
+        return None, None
+    file_ids, index_paths, _ = resolve_indexes(request)
+    versions = {os.path.basename(p): index_version(p) for p in index_paths}
+    with span("query", "embed"):
+        query_vector = get_cached_embeddings().embed_query(request.question)
+    cache_key = (query_vector, file_ids, versions)
+    cached = answer_cache.lookup(*cache_key)
+    count("rag_answer_cache_lookups_total", result="hit" if cached is not None else "miss")
+    return cache_key, cached
+
+def start_turn(request: QueryRequest):
+    """
+    For session queries, loads the session's history window and replaces
+    request.question with a standalone rewrite, which retrieval and the answer
+    cache then use. Returns (question as asked, history text for the prompt).
+    """
+    asked = request.question
+    if not request.session_id:
+        return asked, ""
+    history, request.question = prepare_turn(get_session_store(), request.session_id, asked)
+    return asked, history
+
+def end_turn(request: QueryRequest, asked, answer, background_tasks: BackgroundTasks):
+    # Saved, and older turns summarized, after the response has been sent
+    if request.session_id:
+        background_tasks.add_task(record_turn, get_session_store(), request.session_id, asked, answer, request.question)
+
+def add_session_fields(result, request: QueryRequest):
+    if request.session_id:
+        result["session_id"] = request.session_id
+        result["question"] = request.question  # the standalone question that was searched
+    return result
+
+def finish_query(request: QueryRequest, timings, endpoint, cached, metadatas, answer, context_stats=None):
+    """
+    Records counters and the structured log line for one query.
+    Returns the timing breakdown in milliseconds.
+    """
+    timings_ms = {stage: round(seconds * 1000, 2) for stage, seconds in timings.items()}
+    count("rag_queries_total", endpoint=endpoint, cached=str(cached).lower())
+    count("rag_chunks_retrieved_total", len(metadatas))
+    count("rag_answer_tokens_total", estimate_tokens(answer or ""))
+    log_event("query", endpoint=endpoint, cached=cached, file_id=request.file_id,
+              session_id=request.session_id, chunks=len(metadatas), timings_ms=timings_ms,
+              tokens_saved=context_stats["tokens_saved"] if context_stats else 0)
+    return timings_ms
+
+@app.post("/query")
+async def query_api(request: QueryRequest, background_tasks: BackgroundTasks):
+    timings = start_request()
+    asked, history = await run_in_threadpool(start_turn, request)
+    # Retrieval and OCR block, so they run in worker threads instead of on the event loop
+    cache_key, cached = await run_in_threadpool(cached_answer, request)
+    if cached is not None:
+        result = {"context": cached["context"], "answer": cached["answer"], "sources": cached["sources"], "cached": True}
+        timings_ms = finish_query(request, timings, "query", True, cached["sources"], cached["answer"])
+        end_turn(request, asked, cached["answer"], background_tasks)
+        if request.debug_timing:
+            result["timings"] = timings_ms
+        return add_session_fields(result, request)
+    docs, context, metadatas, context_stats = await run_in_threadpool(
+        retrieve_context, request, cache_key[0] if cache_key else None
+    )
     # LLM QA
     try:
         chain = get_conversational_chain()
-        response = chain({"input_documents": docs, "question": request.question}, return_only_outputs=True)
-        answer = response.get("output_text", "No answer generated.")
+        count("rag_prompt_tokens_total", estimate_tokens(context))
+        with span("query", "llm"):
+            response = await chain.ainvoke({"context": docs, "question": request.question, "history": history})
+        answer = response.get("output_text", "No answer generated.") if isinstance(response, dict) else response
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"LLM failed: {str(e)}")
-    # Add icon and filetype to each metadata
-    for m in metadatas:
-        m["icon"] = filetype_icon(m.get("filetype", ""))
-    return {
+    if cache_key:
+        answer_cache.store(*cache_key, {"context": context, "answer": answer, "sources": metadatas})
+    timings_ms = finish_query(request, timings, "query", False, metadatas, answer, context_stats)
+    end_turn(request, asked, answer, background_tasks)
+    result = {
         "context": context,
         "answer": answer,
         "sources": metadatas
     }
+    if request.debug_timing:
+        result["timings"] = timings_ms
+        result["context_stats"] = context_stats
+    return add_session_fields(result, request)
+
+@app.get("/sessions/{session_id}")
+def get_session(session_id: str):
+    """
+    The session's rolling summary and the recent turns inside its history window.
+    """
+    store = get_session_store()
+    turns = store.turn_count(session_id)
+    if not turns:
+        raise HTTPException(status_code=404, detail="Session not found.")
+    summary, recent = store.window(session_id)
+    return {
+        "session_id": session_id,
+        "turns": turns,
+        "summary": summary,
+        "recent": [{"question": t["question"], "answer": t["answer"]} for t in recent],
+    }
+
+@app.delete("/sessions/{session_id}")
+def delete_session(session_id: str):
+    if not get_session_store().delete(session_id):
+        raise HTTPException(status_code=404, detail="Session not found.")
+    return {"deleted": session_id}
+
+@app.get("/cache/stats")
+def cache_stats():
+    return {"answers": answer_cache.stats(), "indexes": registry.stats()}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """
+    Prometheus scrape endpoint: per-stage latency histograms plus counters.
+    """
+    embeddings = get_cached_embeddings()
+    answers = answer_cache.stats()
+    indexes = registry.stats()
+    sampled = [
+        ("rag_cache_hits_total", {"cache": "embedding"}, embeddings.hits),
+        ("rag_cache_misses_total", {"cache": "embedding"}, embeddings.misses),
+        ("rag_cache_hits_total", {"cache": "answer"}, answers["hits"]),
+        ("rag_cache_misses_total", {"cache": "answer"}, answers["misses"]),
+        ("rag_cache_hits_total", {"cache": "index"}, indexes["hits"]),
+        ("rag_cache_misses_total", {"cache": "index"}, indexes["misses"]),
+    ]
+    # One series per circuit state, 1 for the state each model client's breaker is in
+    circuits = [
+        ("rag_model_circuit_state", {"client": client, "state": state}, int(state == current))
+        for client, current in breaker_states()
+        for state in ("closed", "half_open", "open")
+    ]
+    return PlainTextResponse(render_prometheus(sampled, circuits), media_type="text/plain; version=0.0.4")
+
+@app.post("/query/batch")
+async def query_batch(request: BatchQueryRequest):
+    """
+    Answers many questions in one request. Retrieval is batched (one embedding call,
+    one matrix search per index) and LLM calls run with bounded concurrency.
+    Streams one NDJSON line per question as soon as its answer is ready.
+    """
+    if not request.questions or any(not q or not q.strip() for q in request.questions):
+        raise HTTPException(status_code=400, detail="Every question must be non-empty.")
+    if len(request.questions) > BATCH_MAX_QUESTIONS:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_QUESTIONS} questions per batch.")
+    timings = start_request()
+    retrieved = await run_in_threadpool(retrieve_batch, request)
+    chain = get_conversational_chain()
+    semaphore = asyncio.Semaphore(max(1, request.max_concurrency or BATCH_LLM_CONCURRENCY))
+
+    async def answer(i):
+        question = request.questions[i]
+        docs, context, metadatas, _, cache_key, cached = retrieved[i]
+        result = {"index": i, "question": question}
+        if cached is not None:
+            result.update(context=cached["context"], answer=cached["answer"], sources=cached["sources"], cached=True)
+            return result
+        async with semaphore:
+            count("rag_prompt_tokens_total", estimate_tokens(context))
+            try:
+                with span("query", "llm"):
+                    response = await chain.ainvoke({"context": docs, "question": question})
+            except Exception as e:
+                # One failed question does not fail the rest of the batch
+                result["error"] = f"LLM failed: {str(e)}"
+                return result
+        answer_text = response.get("output_text", "No answer generated.") if isinstance(response, dict) else response
+        answer_cache.store(*cache_key, {"context": context, "answer": answer_text, "sources": metadatas})
+        result.update(context=context, answer=answer_text, sources=metadatas)
+        return result
+
+    async def lines():
+        tasks = [asyncio.ensure_future(answer(i)) for i in range(len(request.questions))]
+        chunks = 0
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                result = await next_done
+                chunks += len(result.get("sources", []))
+                count("rag_queries_total", endpoint="query_batch", cached=str(result.get("cached", False)).lower())
+                yield json.dumps(result, ensure_ascii=False) + "\n"
+        finally:
+            # Client went away: stop the LLM calls that have not finished
+            for task in tasks:
+                task.cancel()
+        timings_ms = {stage: round(seconds * 1000, 2) for stage, seconds in timings.items()}
+        count("rag_chunks_retrieved_total", chunks)
+        tokens_saved = sum(item[3]["tokens_saved"] for item in retrieved if item[3])
+        log_event("query", endpoint="query_batch", questions=len(request.questions), file_id=request.file_id,
+                  chunks=chunks, timings_ms=timings_ms, tokens_saved=tokens_saved)
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.post("/query/stream")
+async def query_stream(request: QueryRequest):
+    """
+    Server-Sent Events: one "sources" event with the retrieved context, then a
+    "token" event per generated piece of the answer, then "done" (or "error").
+    """
+    timings = start_request()
+    asked, history = await run_in_threadpool(start_turn, request)
+    cache_key, cached = await run_in_threadpool(cached_answer, request)
+    if cached is not None:
+        finish_query(request, timings, "query_stream", True, cached["sources"], cached["answer"])
+        background_tasks = BackgroundTasks()
+        end_turn(request, asked, cached["answer"], background_tasks)
+
+        async def cached_events():
+            yield sse_event("sources", add_session_fields(
+                {"context": cached["context"], "sources": cached["sources"], "cached": True}, request))
+            yield sse_event("token", {"text": cached["answer"]})
+            yield sse_event("done", {"cached": True})
+
+        return StreamingResponse(cached_events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"},
+                                 background=background_tasks)
+    docs, context, metadatas, context_stats = await run_in_threadpool(
+        retrieve_context, request, cache_key[0] if cache_key else None
+    )
+    chain = get_conversational_chain()
+
+    async def events():
+        yield sse_event("sources", add_session_fields({"context": context, "sources": metadatas}, request))
+        tokens = []
+        count("rag_prompt_tokens_total", estimate_tokens(context))
+        llm_start = time.perf_counter()
+        try:
+            async for token in chain.astream({"context": docs, "question": request.question, "history": history}):
+                if token:
+                    if not tokens:
+                        observe("query", "llm_first_token", time.perf_counter() - llm_start)
+                    tokens.append(token)
+                    yield sse_event("token", {"text": token})
+        except Exception as e:
+            yield sse_event("error", {"detail": f"LLM failed: {str(e)}"})
+            return
+        observe("query", "llm", time.perf_counter() - llm_start)
+        answer = "".join(tokens)
+        if cache_key:
+            answer_cache.store(*cache_key, {"context": context, "answer": answer, "sources": metadatas})
+        timings_ms = finish_query(request, timings, "query_stream", False, metadatas, answer, context_stats)
+        end_turn(request, asked, answer, background_tasks)
+        yield sse_event("done", {"timings": timings_ms, "context_stats": context_stats} if request.debug_timing else {})
+
+    # Filled in once the answer is complete; runs after the stream ends
+    background_tasks = BackgroundTasks()
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=background_tasks,
+    )
 
 # Helper for file-type icon
 def filetype_icon(ext):
@@ -152,3 +531,52 @@ def filetype_icon(ext):
         ".db": "🗄️",
     }
     return icons.get(ext.lower(), "❓")
+
+
+# Seconds spent importing this module and its dependencies
+IMPORT_SECONDS = time.perf_counter() - _import_start
+startup_state = {"ready": False, "import_seconds": IMPORT_SECONDS, "ready_seconds": None, "warmed_indexes": 0}
+
+
+def warm_up():
+    """
+    Creates the model clients and loads the most recent WARMUP_INDEXES indexes
+    so the first queries do not pay for it. Marks the app ready when done.
+    """
+    warmed = 0
+    try:
+        get_conversational_chain()
+        embeddings = get_cached_embeddings()
+        if WARMUP_INDEXES > 0:
+            paths = [os.path.join(INDEX_DIR, fid) for fid in list_file_ids(INDEX_DIR)]
+            # Most recently published first; versions are opaque strings and do not sort by age
+            paths = sorted(paths, key=lambda p: published_at(p) or 0, reverse=True)
+            for path in paths[:WARMUP_INDEXES]:
+                try:
+                    get_index(path, embeddings)
+                    warmed += 1
+                except Exception:
+                    pass
+    except Exception as e:
+        log_event("warmup_failed", error=str(e))
+    startup_state["ready_seconds"] = time.perf_counter() - _import_start
+    startup_state["warmed_indexes"] = warmed
+    startup_state["ready"] = True
+    observe("startup", "warmup", startup_state["ready_seconds"] - IMPORT_SECONDS)
+    log_event("startup", import_ms=round(IMPORT_SECONDS * 1000, 2),
+              ready_ms=round(startup_state["ready_seconds"] * 1000, 2), warmed_indexes=warmed)
+
+
+@app.on_event("startup")
+def start_warm_up():
+    observe("startup", "import", IMPORT_SECONDS)
+    # In the background: the server accepts requests right away and /ready reports progress
+    threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+
+
+@app.get("/ready")
+def ready():
+    """
+    Readiness probe: 503 until warm-up has finished, then the startup timings.
+    """
+    return JSONResponse(startup_state, status_code=200 if startup_state["ready"] else 503)
@@ -0,0 +1,198 @@
+# Incremental FAISS index updates: add, replace and delete documents without full rebuilds
+import os
+import threading
+import uuid
+
+from langchain_community.vectorstores import FAISS
+
+from ann_index import INDEX_TYPE, IVF_RETRAIN_EVERY, index_type_of, is_flat, load_vectorstore, to_flat
+from embedding_scheduler import EmbeddingScheduler
+from index_registry import registry, save_index
+from index_store import current_generation, index_state, retire
+from lexical_index import BM25Index, build_lexical_index, load_lexical_index
+
+# Rebuild the index after this many chunks have been deleted since the last compaction
+COMPACT_EVERY = int(os.getenv("INDEX_COMPACT_EVERY", "5000"))
+
+
+def document_key(metadata):
+    # Documents are identified by file_id (API uploads) or filename (Streamlit app)
+    return metadata.get("file_id") or metadata.get("filename")
+
+
+def write_index_atomically(vectorstore, index_path, lexical_index=None):
+    """
+    Publishes vectorstore as a new generation of index_path: readers see either
+    the old or the new index, never a half-written one.
+    """
+    return save_index(vectorstore, index_path, lexical_index)
+
+
+class IncrementalIndexManager:
+    """
+    Keeps a docstore ID map (document key -> chunk ids) for one FAISS index so
+    documents can be appended, replaced or deleted in time proportional to the change.
+    Edits from several processes must hold index_store.index_lock(index_path)
+    from before the manager is created until after save(), or one can overwrite
+    another's changes.
+    """
+
+    def __init__(self, index_path, embeddings, compact_every=COMPACT_EVERY, retrain_every=IVF_RETRAIN_EVERY):
+        self.index_path = index_path
+        self.embeddings = embeddings
+        self.compact_every = compact_every
+        self.retrain_every = retrain_every
+        self._lock = threading.RLock()
+        # Chunks deleted since the last compaction and saved edits since the IVF index was
+        # trained; managers live for one edit, so both are kept in the index's manifest
+        self._deleted_since_compact = 0
+        self._edits_since_train = 0
+        # Trained IVF index (emptied) that save() adds the vectors of a flattened index back to
+        self._trained = None
+        self.vectorstore = None
+        self.lexical_index = BM25Index()
+        self._doc_ids = {}
+        generation = current_generation(index_path)
+        if generation is not None:
+            # Private, fully read copy of the current generation: cached registry copies
+            # keep serving queries until save() publishes the next one
+            self.vectorstore = load_vectorstore(generation[1], embeddings, mmap=False)
+            state = index_state(index_path)
+            self._deleted_since_compact = state.get("deleted_since_compact", 0)
+            self._edits_since_train = state.get("edits_since_train", 0)
+            loaded_type = index_type_of(self.vectorstore.index)
+            if loaded_type not in ("ivf_flat", "ivf_pq") or loaded_type != INDEX_TYPE:
+                # Only IVF indexes of the configured type are appended to in place; HNSW and
+                # indexes of another type are edited flat and rebuilt on save
+                to_flat(self.vectorstore, embeddings)
+            for doc_id in self.vectorstore.index_to_docstore_id.values():
+                doc = self.vectorstore.docstore.search(doc_id)
+                self._doc_ids.setdefault(document_key(doc.metadata), []).append(doc_id)
+            self.lexical_index = load_lexical_index(generation[1]) or build_lexical_index(self.vectorstore)
+
+    def add_document(self, key, texts, metadatas, progress=None):
+        """
+        Embeds and appends the chunks of one document.
+        """
+        if not texts:
+            return
+        ids = [f"{key}:{uuid.uuid4().hex}" for _ in texts]
+        with self._lock:
+            self.vectorstore = EmbeddingScheduler(self.embeddings).build_index(
+                texts, metadatas, vectorstore=self.vectorstore, progress=progress, ids=ids
+            )
+            for doc_id, text in zip(ids, texts):
+                self.lexical_index.add(doc_id, text)
+            self._doc_ids.setdefault(key, []).extend(ids)
+
+    def add_vectorstore(self, key, vectorstore):
+        """
+        Appends an already embedded vector store holding the chunks of one document.
+        """
+        with self._lock:
+            ids = list(vectorstore.index_to_docstore_id.values())
+            for doc_id in ids:
+                self.lexical_index.add(doc_id, vectorstore.docstore.search(doc_id).page_content)
+            if self.vectorstore is None:
+                self.vectorstore = vectorstore
+            elif is_flat(self.vectorstore.index):
+                self.vectorstore.merge_from(vectorstore)
+            else:
+                # A trained IVF index takes the new (flat, exact) vectors as they are
+                positions = sorted(vectorstore.index_to_docstore_id)
+                docs = [vectorstore.docstore.search(vectorstore.index_to_docstore_id[p]) for p in positions]
+                vectors = vectorstore.index.reconstruct_n(0, vectorstore.index.ntotal)
+                self.vectorstore.add_embeddings(
+                    [(doc.page_content, vectors[p]) for doc, p in zip(docs, positions)],
+                    metadatas=[doc.metadata for doc in docs], ids=[vectorstore.index_to_docstore_id[p] for p in positions],
+                )
+            self._doc_ids.setdefault(key, []).extend(ids)
+
+    def replace_document(self, key, texts, metadatas, progress=None):
+        with self._lock:
+            self.delete_document(key)
+            self.add_document(key, texts, metadatas, progress=progress)
+
+    def replace_vectorstore(self, key, vectorstore):
+        with self._lock:
+            self.delete_document(key)
+            self.add_vectorstore(key, vectorstore)
+
+    def delete_document(self, key):
+        """
+        Removes every chunk of a document; returns the number of chunks removed.
+        """
+        with self._lock:
+            ids = self._doc_ids.pop(key, [])
+            if not ids or self.vectorstore is None:
+                return 0
+            for doc_id in ids:
+                self.lexical_index.remove(doc_id, self.vectorstore.docstore.search(doc_id).page_content)
+            if len(ids) == self.vectorstore.index.ntotal:
+                # FAISS cannot hold an empty index usefully; drop it entirely
+                self.vectorstore = None
+            else:
+                self._flatten()
+                self.vectorstore.delete(ids)
+            self._deleted_since_compact += len(ids)
+            if self.vectorstore is not None and self._deleted_since_compact >= self.compact_every:
+                self.compact()
+            return len(ids)
+
+    def _flatten(self):
+        # Deletions need a flat index; a trained IVF index is kept (emptied) for save() to refill
+        index = self.vectorstore.index
+        if is_flat(index):
+            return
+        to_flat(self.vectorstore, self.embeddings)
+        if index_type_of(index) in ("ivf_flat", "ivf_pq"):
+            index.reset()
+            self._trained = index
+
+    def compact(self):
+        """
+        Rebuilds the index from its remaining vectors, dropping orphaned docstore
+        entries and the memory left behind by deletions. An ANN index is retrained
+        on the next save().
+        """
+        with self._lock:
+            self._deleted_since_compact = 0
+            if self.vectorstore is None:
+                return
+            self._flatten()
+            self._trained = None
+            store = self.vectorstore
+            positions = sorted(store.index_to_docstore_id)
+            text_embeddings, metadatas, ids = [], [], []
+            for position in positions:
+                doc_id = store.index_to_docstore_id[position]
+                doc = store.docstore.search(doc_id)
+                text_embeddings.append((doc.page_content, store.index.reconstruct(position).tolist()))
+                metadatas.append(doc.metadata)
+                ids.append(doc_id)
+            self.vectorstore = FAISS.from_embeddings(
+                text_embeddings, self.embeddings, metadatas=metadatas, ids=ids,
+                distance_strategy=store.distance_strategy,
+            )
+
+    def save(self):
+        """
+        Publishes the edited index. A trained IVF index gets the new vectors added
+        to it; it is only retrained every retrain_every saves or after compact().
+        """
+        with self._lock:
+            if self.vectorstore is None:
+                retire(self.index_path)
+                registry.invalidate(self.index_path)
+                return
+            if self._edits_since_train + 1 >= self.retrain_every:
+                self._flatten()
+                self._trained = None
+            if is_flat(self.vectorstore.index) and self._trained is None:
+                # Trained from scratch on save (or small enough to stay flat)
+                self._edits_since_train = 0
+            else:
+                self._edits_since_train += 1
+            save_index(self.vectorstore, self.index_path, self.lexical_index, trained=self._trained,
+                       state={"edits_since_train": self._edits_since_train,
+                              "deleted_since_compact": self._deleted_since_compact})
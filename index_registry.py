@@ -0,0 +1,133 @@
+# Process-wide cache of loaded FAISS indexes shared by the API and Streamlit app
+import copy
+import os
+import threading
+from collections import OrderedDict
+
+from ann_index import convert_index, load_vectorstore
+from index_store import current_generation, publish
+from lexical_index import LEXICAL_FILE, build_lexical_index, load_lexical_index
+
+# Memory budget for loaded indexes, estimated from their size on disk
+DEFAULT_MAX_BYTES = int(os.getenv("INDEX_CACHE_MAX_BYTES", str(1024 * 1024 * 1024)))
+
+
+def save_index(vectorstore, index_path, lexical_index=None, trained=None, state=None):
+    """
+    Saves a FAISS vector store as a new generation of index_path (index_store.py),
+    so readers in every process switch to it on their next lookup and never see
+    it half-written. Large flat indexes are saved as the configured INDEX_TYPE
+    (added to trained instead of training, if given); the caller's store is not
+    changed. The BM25 index is saved alongside (built from the docstore if not
+    given). state is kept in the manifest. Returns the new version.
+    """
+    def write(generation_path):
+        os.makedirs(generation_path)
+        convert_index(copy.copy(vectorstore), trained=trained).save_local(generation_path)
+        (lexical_index or build_lexical_index(vectorstore)).save(generation_path)
+
+    return publish(index_path, write, state)
+
+
+def index_version(index_path):
+    """
+    Returns the version of the index stored at index_path, or None if there is no index.
+    """
+    generation = current_generation(index_path)
+    return generation[0] if generation else None
+
+
+def _index_size(index_path):
+    size = 0
+    for name in ("index.faiss", "index.pkl", LEXICAL_FILE):
+        try:
+            size += os.path.getsize(os.path.join(index_path, name))
+        except OSError:
+            pass
+    return size
+
+
+class IndexRegistry:
+    """
+    Loads each FAISS index once and keeps it in memory until its manifest names
+    a new generation or it is evicted (least recently used first) to stay under
+    max_bytes. A loaded generation is immutable, so queries holding it are
+    unaffected by writers.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # abs path -> (version, size, vectorstore)
+        self._lock = threading.Lock()
+        self._total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, index_path, embeddings):
+        key = os.path.abspath(index_path)
+        for attempt in range(3):
+            generation = current_generation(key)
+            if generation is None:
+                raise FileNotFoundError(f"No FAISS index found at {index_path}")
+            version, generation_path = generation
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and entry[0] == version:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[2]
+                self.misses += 1
+            try:
+                # Load outside the lock so other indexes can still be served meanwhile
+                vectorstore = load_vectorstore(generation_path, embeddings)
+                # BM25 postings for hybrid search; None for indexes saved without them
+                vectorstore.lexical_index = load_lexical_index(generation_path)
+                if vectorstore.lexical_index is None and not os.path.isdir(generation_path):
+                    raise FileNotFoundError(generation_path)
+                break
+            except (FileNotFoundError, RuntimeError):
+                # Pruned by writers between the manifest read and the load: read it again
+                # (FAISS reports a missing file as a RuntimeError)
+                if attempt == 2:
+                    raise
+        size = _index_size(generation_path)
+        with self._lock:
+            self._discard(key)
+            self._entries[key] = (version, size, vectorstore)
+            self._total_bytes += size
+            # Never evict the index we just loaded, even if it alone exceeds the budget
+            while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+                oldest = next(iter(self._entries))
+                self._discard(oldest)
+        return vectorstore
+
+    def invalidate(self, index_path=None):
+        with self._lock:
+            if index_path is None:
+                self._entries.clear()
+                self._total_bytes = 0
+            else:
+                self._discard(os.path.abspath(index_path))
+
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._total_bytes -= entry[1]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "indexes": len(self._entries),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+# Shared registry used by fastapi_app and main
+registry = IndexRegistry()
+
+
+def get_index(index_path, embeddings):
+    return registry.get(index_path, embeddings)
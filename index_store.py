@@ -0,0 +1,192 @@
+# Generation-numbered index storage shared by worker processes: writers publish immutable
+# generation directories under an advisory file lock, readers follow an atomically swapped manifest
+import fcntl
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+MANIFEST_FILE = "MANIFEST"
+LOCK_FILE = ".lock"
+GENERATION_PREFIX = "gen-"
+# Generations kept on disk after a publish, so readers that pinned an older one can finish with it
+INDEX_KEEP_GENERATIONS = max(1, int(os.getenv("INDEX_KEEP_GENERATIONS", "3")))
+# Files of an index saved directly into its directory (before generations existed)
+LEGACY_FILES = ("index.faiss", "index.pkl", "bm25.pkl", "index.version")
+
+_locks = {}  # abs index path -> {"rlock", "fd", "depth"}
+_locks_guard = threading.Lock()
+
+
+def is_generation_dir(name):
+    # Generation and temporary directories inside an index path, which are not indexes of their own
+    return name.startswith(GENERATION_PREFIX) or name.startswith(".")
+
+
+@contextmanager
+def index_lock(index_path):
+    """
+    Exclusive writer lock for one index: an fcntl advisory lock on index_path/.lock,
+    so uvicorn workers and the Streamlit app take turns. Re-entrant within a
+    thread and serializes threads of this process. Readers never take it.
+    """
+    key = os.path.abspath(index_path)
+    with _locks_guard:
+        entry = _locks.setdefault(key, {"rlock": threading.RLock(), "fd": None, "depth": 0})
+    with entry["rlock"]:
+        if entry["depth"] == 0:
+            os.makedirs(key, exist_ok=True)
+            fd = os.open(os.path.join(key, LOCK_FILE), os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            except BaseException:
+                os.close(fd)
+                raise
+            entry["fd"] = fd
+        entry["depth"] += 1
+        try:
+            yield
+        finally:
+            entry["depth"] -= 1
+            if entry["depth"] == 0:
+                # Closing the descriptor releases the lock
+                os.close(entry["fd"])
+                entry["fd"] = None
+
+
+def read_manifest(index_path):
+    try:
+        with open(os.path.join(index_path, MANIFEST_FILE), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def current_generation(index_path):
+    """
+    Returns (version, directory holding the index files) for the generation the
+    manifest names, or None if there is no index. Indexes saved before
+    generations existed are served from index_path itself.
+    """
+    manifest = read_manifest(index_path)
+    if manifest is not None:
+        return manifest["version"], os.path.join(index_path, manifest["path"])
+    try:
+        with open(os.path.join(index_path, "index.version")) as f:
+            return f.read().strip(), index_path
+    except OSError:
+        pass
+    try:
+        version = "|".join(
+            str(os.stat(os.path.join(index_path, name)).st_mtime_ns) for name in ("index.faiss", "index.pkl")
+        )
+    except OSError:
+        return None
+    return version, index_path
+
+
+def index_state(index_path):
+    # Writer bookkeeping saved with the current generation by publish(state=...)
+    manifest = read_manifest(index_path)
+    return (manifest or {}).get("state", {})
+
+
+def published_at(index_path):
+    """
+    Epoch seconds at which the current generation was published (index file
+    mtime for indexes saved before generations existed), or None if there is no index.
+    """
+    manifest = read_manifest(index_path)
+    if manifest is not None:
+        return manifest["created"]
+    try:
+        return os.stat(os.path.join(index_path, "index.faiss")).st_mtime
+    except OSError:
+        return None
+
+
+def _fsync_dir(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _generation_numbers(index_path):
+    numbers = []
+    for name in os.listdir(index_path):
+        if name.startswith(GENERATION_PREFIX) and name[len(GENERATION_PREFIX):].isdigit():
+            numbers.append(int(name[len(GENERATION_PREFIX):]))
+    return sorted(numbers)
+
+
+def publish(index_path, write, state=None):
+    """
+    Writes a new generation with write(directory) and makes it current by
+    swapping the manifest. Takes the index lock (re-entrant, so callers doing a
+    read-modify-write can hold it around the whole edit). state, a small JSON
+    dict, is kept in the manifest for the next writer (see index_state).
+    Returns the version.
+    """
+    with index_lock(index_path):
+        manifest = read_manifest(index_path) or {"generation": 0}
+        generation = max([manifest["generation"], *_generation_numbers(index_path)]) + 1
+        name = f"{GENERATION_PREFIX}{generation:08d}"
+        tmp_path = os.path.join(index_path, f".{name}.tmp-{uuid.uuid4().hex}")
+        try:
+            write(tmp_path)
+            os.rename(tmp_path, os.path.join(index_path, name))
+        except BaseException:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            raise
+        version = f"{generation}.{time.time_ns()}"
+        manifest = {"generation": generation, "path": name, "version": version, "created": time.time(),
+                    "state": state or {}}
+        manifest_tmp = os.path.join(index_path, f".{MANIFEST_FILE}.{uuid.uuid4().hex}.tmp")
+        with open(manifest_tmp, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(manifest_tmp, os.path.join(index_path, MANIFEST_FILE))
+        _fsync_dir(index_path)
+        _prune(index_path, generation)
+        return version
+
+
+def retire(index_path):
+    """
+    Deletes an index: readers see no index from the next manifest read on. The
+    directory and its lock file stay, so a writer waiting on the lock is not
+    left holding a lock nobody else can see.
+    """
+    with index_lock(index_path):
+        try:
+            os.remove(os.path.join(index_path, MANIFEST_FILE))
+        except OSError:
+            pass
+        _prune(index_path, None)
+
+
+def _prune(index_path, current):
+    # Caller holds the lock, so temp directories left behind are from crashed writers
+    keep = set()
+    if current is not None:
+        keep = {n for n in _generation_numbers(index_path) if n <= current}
+        keep = set(sorted(keep)[-INDEX_KEEP_GENERATIONS:])
+    for name in os.listdir(index_path):
+        path = os.path.join(index_path, name)
+        if name.startswith(GENERATION_PREFIX) and name[len(GENERATION_PREFIX):].isdigit():
+            if int(name[len(GENERATION_PREFIX):]) not in keep:
+                # Processes that mapped the old files keep them until they let go (POSIX unlink)
+                shutil.rmtree(path, ignore_errors=True)
+        elif name.startswith(f".{GENERATION_PREFIX}") or (name.startswith(f".{MANIFEST_FILE}.") and name.endswith(".tmp")):
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                os.remove(path)
+        elif name in LEGACY_FILES:
+            os.remove(path)
@@ -0,0 +1,281 @@
+# Background ingestion: /upload enqueues a job, extraction runs in a process pool
+# and embedding/index writes run in a thread pool, so queries are never blocked.
+import multiprocessing
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from instrumentation import count, log_event, observe, span, start_request
+
+INGEST_PROCESS_WORKERS = int(os.getenv("INGEST_PROCESS_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+INGEST_THREAD_WORKERS = int(os.getenv("INGEST_THREAD_WORKERS", "2"))
+# Queued + running jobs allowed before /upload starts rejecting with 429
+INGEST_MAX_PENDING = int(os.getenv("INGEST_MAX_PENDING", "16"))
+# Chunks per batch handed from the extraction worker to the embedder, and batches that may
+# wait in between: memory per upload stays bounded however large the file is
+INGEST_STREAM_BATCH = int(os.getenv("INGEST_STREAM_BATCH", "500"))
+INGEST_QUEUE_BATCHES = int(os.getenv("INGEST_QUEUE_BATCHES", "4"))
+# Finished jobs kept around for /jobs/{id}
+JOB_HISTORY_SIZE = 1000
+
+
+class QueueFullError(Exception):
+    pass
+
+
+def _put(batches, stop, item):
+    # Blocks while the queue is full (the embedder is behind); gives up once the job is cancelled
+    while True:
+        try:
+            batches.put(item, timeout=1)
+            return
+        except queue.Full:
+            if stop.is_set():
+                raise _Cancelled()
+
+
+class _Cancelled(Exception):
+    pass
+
+
+def _init_extraction_worker():
+    # The pool already runs INGEST_PROCESS_WORKERS extractions side by side: PDFs and OCR
+    # run inline in each worker rather than in nested pools per worker
+    import ocr
+    import pdf_chunk_helper
+
+    pdf_chunk_helper.PDF_EXTRACT_WORKERS = 1
+    ocr.OCR_WORKERS = 0
+
+
+def extract_chunks(file_path, batches, stop, chunk_size=1000, chunk_overlap=200, batch_size=None):
+    """
+    Extracts a document in a worker process and streams it back through the
+    bounded batches queue as ("chunks", [(text, page, metadata), ...]) items,
+    with ("progress", table, rows_done) for CSV/DB files, then ("done", timings)
+    or ("error", message). The extractors already chunk with the shared engine
+    (CHUNK_LENGTH_UNIT aware), so their chunks are used as they are.
+    """
+    from document_ingestor import DocumentIngestor
+
+    batch_size = batch_size or INGEST_STREAM_BATCH
+    batch = []
+    blocked = 0.0
+    start = time.perf_counter()
+
+    def send(item):
+        nonlocal blocked
+        put_start = time.perf_counter()
+        _put(batches, stop, item)
+        blocked += time.perf_counter() - put_start
+
+    try:
+        chunks = DocumentIngestor.extract_with_metadata(
+            file_path, chunk_size, chunk_overlap, progress=lambda table, rows: send(("progress", table, rows)),
+        )
+        for text, page, metadata in chunks:
+            if not text or not text.strip():
+                continue
+            batch.append((text, page, metadata))
+            if len(batch) >= batch_size:
+                send(("chunks", batch))
+                batch = []
+        if batch:
+            send(("chunks", batch))
+        # Time spent waiting for the embedder is not extraction time
+        send(("done", {"extract": time.perf_counter() - start - blocked}))
+    except _Cancelled:
+        pass
+    except Exception as e:
+        try:
+            _put(batches, stop, ("error", str(e) or type(e).__name__))
+        except _Cancelled:
+            pass
+
+
+class IngestionJobManager:
+    def __init__(
+        self,
+        index_dir,
+        process_workers=INGEST_PROCESS_WORKERS,
+        thread_workers=INGEST_THREAD_WORKERS,
+        max_pending=INGEST_MAX_PENDING,
+    ):
+        self.index_dir = index_dir
+        self.process_workers = process_workers
+        self.thread_workers = thread_workers
+        self.max_pending = max_pending
+        self._jobs = OrderedDict()
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._process_pool = None
+        self._queue_manager = None
+        self._thread_pool = None
+
+    def _pools(self):
+        # Created on first use so importing the API does not spawn workers
+        if self._thread_pool is None:
+            # spawn: forking a process that already runs threads can deadlock
+            context = multiprocessing.get_context("spawn")
+            self._process_pool = ProcessPoolExecutor(
+                max_workers=self.process_workers, mp_context=context, initializer=_init_extraction_worker
+            )
+            # Proxied queues and events can be passed to pool workers, plain multiprocessing ones cannot
+            self._queue_manager = context.Manager()
+            self._thread_pool = ThreadPoolExecutor(max_workers=self.thread_workers)
+        return self._process_pool, self._thread_pool
+
+    def submit(self, file_path, filename, file_id, timings=None):
+        """
+        Queues a file for ingestion and returns its job dict.
+        Raises QueueFullError when max_pending jobs are already queued or running.
+        """
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise QueueFullError(f"Ingestion queue is full ({self.max_pending} jobs pending).")
+            # Pools first: if they fail to start, no slot is taken
+            process_pool, thread_pool = self._pools()
+            self._pending += 1
+            job = {
+                "job_id": uuid.uuid4().hex,
+                "status": "queued",
+                "file_id": file_id,
+                "filename": filename,
+                "pages_extracted": 0,
+                "chunks_total": 0,
+                "chunks_embedded": 0,
+                "rows_extracted": 0,  # CSV/DB files
+                "index_written": False,
+                "error": None,
+                "timings": dict(timings or {}),
+                "created_at": time.time(),
+                "finished_at": None,
+            }
+            self._jobs[job["job_id"]] = job
+            while len(self._jobs) > JOB_HISTORY_SIZE:
+                self._jobs.popitem(last=False)
+        try:
+            thread_pool.submit(self._run, job, file_path, process_pool)
+        except BaseException:
+            # e.g. the pool is shutting down: _run will never release the slot
+            with self._lock:
+                self._pending -= 1
+                self._jobs.pop(job["job_id"], None)
+            raise
+        return dict(job)
+
+    def active_job(self, file_id):
+        """
+        Returns the queued or running job for file_id, if any.
+        """
+        with self._lock:
+            for job in reversed(self._jobs.values()):
+                if job["file_id"] == file_id and job["status"] not in ("done", "failed"):
+                    return dict(job)
+        return None
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def _update(self, job, **changes):
+        with self._lock:
+            job.update(changes)
+
+    def _stream_chunks(self, job, file_path, process_pool, timings):
+        """
+        Runs extract_chunks in a worker and yields its chunk batches as they
+        arrive, updating the job's extraction progress.
+        """
+        batches = self._queue_manager.Queue(maxsize=max(1, INGEST_QUEUE_BATCHES))
+        stop = self._queue_manager.Event()
+        future = process_pool.submit(extract_chunks, file_path, batches, stop)
+        table_rows = {}  # rows_done is per table for DB files
+        try:
+            while True:
+                try:
+                    item = batches.get(timeout=1)
+                except queue.Empty:
+                    if future.done():
+                        future.result()
+                        raise RuntimeError("Extraction worker exited without finishing.")
+                    continue
+                if item[0] == "chunks":
+                    yield item[1]
+                elif item[0] == "progress":
+                    table_rows[item[1]] = item[2]
+                    self._update(job, rows_extracted=sum(table_rows.values()))
+                elif item[0] == "done":
+                    for stage, seconds in item[1].items():
+                        observe("upload", stage, seconds)
+                        timings[stage] = timings.get(stage, 0.0) + seconds
+                    return
+                else:
+                    raise ValueError(item[1])
+        finally:
+            # Unblocks the worker if embedding failed part way through
+            stop.set()
+
+    def _run(self, job, file_path, process_pool):
+        from embedding_cache import get_cached_embeddings
+        from embedding_scheduler import EmbeddingScheduler
+        from index_manager import write_index_atomically
+        from multi_index_search import MERGED_CORPUS_INDEX, add_to_corpus
+
+        timings = start_request()
+        timings.update(job["timings"])
+        try:
+            self._update(job, status="extracting")
+            ext = os.path.splitext(job["filename"])[1].lower()
+            embeddings = get_cached_embeddings()
+            scheduler = EmbeddingScheduler(embeddings)
+            vectorstore = None
+            chunks = 0
+            pages = 0
+            last_page = None
+            # Each batch is embedded and added to the index while the worker extracts the next
+            for batch in self._stream_chunks(job, file_path, process_pool, timings):
+                metadatas = []
+                for i, (_, page, meta) in enumerate(batch, start=chunks):
+                    if page != last_page:
+                        pages += 1
+                        last_page = page
+                    metadatas.append(dict(meta, filename=job["filename"], chunk=i, page=page, filetype=ext,
+                                          file_id=job["file_id"]))
+                chunks += len(batch)
+                self._update(job, status="embedding", pages_extracted=pages, chunks_total=chunks)
+                done_before = job["chunks_embedded"]
+                with span("upload", "embed"):
+                    vectorstore = scheduler.build_index(
+                        [text for text, _, _ in batch], metadatas, vectorstore=vectorstore,
+                        progress=lambda done, total: self._update(job, chunks_embedded=done_before + done),
+                    )
+            if vectorstore is None:
+                raise ValueError("No extractable text found in file.")
+            count("rag_chunks_ingested_total", chunks, filetype=ext)
+            self._update(job, status="writing")
+            with span("upload", "save"):
+                # Re-uploads replace the document's index in one atomic swap
+                write_index_atomically(vectorstore, os.path.join(self.index_dir, job["file_id"]))
+                if MERGED_CORPUS_INDEX:
+                    add_to_corpus(vectorstore, job["file_id"], self.index_dir, embeddings)
+            self._update(job, status="done", index_written=True, finished_at=time.time())
+        except Exception as e:
+            self._update(job, status="failed", error=str(e), finished_at=time.time())
+        finally:
+            self._update(job, timings={stage: round(s * 1000, 2) for stage, s in timings.items()})
+            count("rag_uploads_total", status=job["status"])
+            log_event("upload", job_id=job["job_id"], file_id=job["file_id"], status=job["status"],
+                      chunks=job["chunks_total"], timings_ms=job["timings"], error=job["error"])
+            with self._lock:
+                self._pending -= 1
+            # Clean up uploaded file to save space
+            try:
+                os.remove(file_path)
+            except Exception:
+                pass
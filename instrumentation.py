@@ -0,0 +1,133 @@
+# Per-stage latency instrumentation, counters, Prometheus export and structured JSON logs
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Stage timings of the request being handled; None outside a request
+_request_timings = contextvars.ContextVar("request_timings", default=None)
+_lock = threading.Lock()
+_histograms = {}  # (pipeline, stage) -> [bucket counts..., sum, count]
+_counters = {}  # (name, labels) -> value
+
+
+class _JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {"ts": round(record.created, 3), "level": record.levelname, "logger": record.name}
+        fields = getattr(record, "fields", None)
+        if fields:
+            entry.update(fields)
+        else:
+            entry["message"] = record.getMessage()
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+logger = logging.getLogger("rag")
+if not logger.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(_JsonFormatter())
+    logger.addHandler(_handler)
+    logger.setLevel(os.getenv("LOG_LEVEL", "INFO"))
+    logger.propagate = False
+
+
+def log_event(event, **fields):
+    logger.info(event, extra={"fields": dict(event=event, **fields)})
+
+
+def start_request():
+    """
+    Starts collecting stage timings for the current request and returns the dict
+    they are accumulated in (stage -> seconds). Worker threads started with
+    starlette's run_in_threadpool or run_in_context() share it.
+    """
+    timings = {}
+    _request_timings.set(timings)
+    return timings
+
+
+def run_in_context(executor, fn, *args):
+    # Submits fn so its spans are attributed to the current request
+    return executor.submit(contextvars.copy_context().run, fn, *args)
+
+
+def observe(pipeline, stage, seconds):
+    key = (pipeline, stage)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = [0] * len(LATENCY_BUCKETS) + [0.0, 0]
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                histogram[i] += 1
+        histogram[-2] += seconds
+        histogram[-1] += 1
+        timings = _request_timings.get()
+        if timings is not None:
+            # Stages that run once per index (load, search) are summed, from parallel search threads too
+            timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+@contextmanager
+def span(pipeline, stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(pipeline, stage, time.perf_counter() - start)
+
+
+def count(name, value=1, **labels):
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(pairs):
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def render_prometheus(extra_counters=None, gauges=None):
+    """
+    Renders all histograms and counters in the Prometheus text exposition format.
+    extra_counters and gauges are iterables of (name, labels dict, value) sampled at scrape time.
+    """
+    lines = [
+        "# HELP rag_stage_seconds Latency of each upload/query pipeline stage.",
+        "# TYPE rag_stage_seconds histogram",
+    ]
+    with _lock:
+        histograms = {k: list(v) for k, v in _histograms.items()}
+        counters = dict(_counters)
+    for (pipeline, stage), histogram in sorted(histograms.items()):
+        base = [("pipeline", pipeline), ("stage", stage)]
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            lines.append(f"rag_stage_seconds_bucket{_labels(base + [('le', bound)])} {histogram[i]}")
+        lines.append(f"rag_stage_seconds_bucket{_labels(base + [('le', '+Inf')])} {histogram[-1]}")
+        lines.append(f"rag_stage_seconds_sum{_labels(base)} {histogram[-2]}")
+        lines.append(f"rag_stage_seconds_count{_labels(base)} {histogram[-1]}")
+    for name, labels, value in extra_counters or ():
+        counters[(name, tuple(sorted(labels.items())))] = value
+    for name in sorted({name for name, _ in counters}):
+        lines.append(f"# TYPE {name} counter")
+        for (counter_name, labels), value in sorted(counters.items()):
+            if counter_name == name:
+                lines.append(f"{name}{_labels(list(labels))} {value}")
+    gauges = list(gauges or ())
+    for name in sorted({name for name, _, _ in gauges}):
+        lines.append(f"# TYPE {name} gauge")
+        for gauge_name, labels, value in gauges:
+            if gauge_name == name:
+                lines.append(f"{name}{_labels(sorted(labels.items()))} {value}")
+    return "\n".join(lines) + "\n"
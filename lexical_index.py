@@ -0,0 +1,124 @@
+# BM25 inverted index stored next to each FAISS index, and reciprocal-rank fusion with vector hits
+import heapq
+import math
+import os
+import pickle
+import re
+from collections import Counter
+
+LEXICAL_FILE = "bm25.pkl"
+HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "1") == "1"
+BM25_K1 = float(os.getenv("BM25_K1", "1.2"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+# Reciprocal-rank fusion constant: larger values flatten the advantage of top ranks
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+# Clause numbers ("4.2.1") stay whole; Indic blocks are listed because their vowel
+# signs are combining marks, which \w alone would split words on (e.g. Bengali)
+_TOKEN_RE = re.compile(r"\d+(?:\.\d+)+|[\w\u0900-\u0DFF]+", re.UNICODE)
+
+
+def tokenize(text):
+    return _TOKEN_RE.findall(text.lower())
+
+
+class BM25Index:
+    """
+    Okapi BM25 over docstore ids: term -> {doc_id: term frequency}. Documents can
+    be added and removed one at a time, so it follows incremental FAISS updates.
+    """
+
+    def __init__(self, k1=BM25_K1, b=BM25_B):
+        self.k1 = k1
+        self.b = b
+        self.postings = {}
+        self.doc_lengths = {}
+        self.total_length = 0
+
+    def __len__(self):
+        return len(self.doc_lengths)
+
+    def add(self, doc_id, text):
+        terms = Counter(tokenize(text))
+        for term, tf in terms.items():
+            self.postings.setdefault(term, {})[doc_id] = tf
+        length = sum(terms.values())
+        self.doc_lengths[doc_id] = length
+        self.total_length += length
+
+    def remove(self, doc_id, text):
+        # text is the removed chunk's content: its terms locate the postings to update
+        length = self.doc_lengths.pop(doc_id, None)
+        if length is None:
+            return
+        self.total_length -= length
+        for term in set(tokenize(text)):
+            docs = self.postings.get(term)
+            if docs is not None:
+                docs.pop(doc_id, None)
+                if not docs:
+                    del self.postings[term]
+
+    def search(self, query, k=10, keep=None):
+        """
+        Returns up to k (doc_id, score) pairs, best first. keep(doc_id) can
+        exclude documents (e.g. other files) before the top k is taken.
+        """
+        if not self.doc_lengths:
+            return []
+        count = len(self.doc_lengths)
+        average = self.total_length / count or 1.0
+        scores = {}
+        for term in set(tokenize(query)):
+            docs = self.postings.get(term)
+            if not docs:
+                continue
+            idf = math.log(1 + (count - len(docs) + 0.5) / (len(docs) + 0.5))
+            for doc_id, tf in docs.items():
+                norm = tf + self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / average)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / norm
+        items = scores.items()
+        if keep is not None:
+            items = [item for item in items if keep(item[0])]
+        return heapq.nlargest(k, items, key=lambda item: item[1])
+
+    def save(self, index_path):
+        tmp_path = os.path.join(index_path, f".{LEXICAL_FILE}.{os.getpid()}.tmp")
+        with open(tmp_path, "wb") as f:
+            pickle.dump((self.postings, self.doc_lengths, self.total_length), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, os.path.join(index_path, LEXICAL_FILE))
+
+
+def build_lexical_index(vectorstore):
+    index = BM25Index()
+    for doc_id in vectorstore.index_to_docstore_id.values():
+        index.add(doc_id, vectorstore.docstore.search(doc_id).page_content)
+    return index
+
+
+def load_lexical_index(index_path):
+    # None for indexes saved before lexical indexes existed
+    try:
+        with open(os.path.join(index_path, LEXICAL_FILE), "rb") as f:
+            postings, doc_lengths, total_length = pickle.load(f)
+    except OSError:
+        return None
+    index = BM25Index()
+    index.postings, index.doc_lengths, index.total_length = postings, doc_lengths, total_length
+    return index
+
+
+def reciprocal_rank_fusion(ranked_lists, k, rrf_k=RRF_K):
+    """
+    Fuses (doc, score) lists, each best first, into the top k (doc, fused score)
+    pairs. Documents are matched by identity: all lists come from the same
+    loaded docstores.
+    """
+    fused = {}
+    docs = {}
+    for ranked in ranked_lists:
+        for rank, (doc, _) in enumerate(ranked):
+            fused[id(doc)] = fused.get(id(doc), 0.0) + 1.0 / (rrf_k + rank + 1)
+            docs[id(doc)] = doc
+    best = sorted(fused.items(), key=lambda item: item[1], reverse=True)[:k]
+    return [(docs[key], score) for key, score in best]
@@ -0,0 +1,75 @@
+# Deterministic offline stand-ins for the Gemini models
+import hashlib
+import math
+import re
+
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+class HashEmbeddings(Embeddings):
+    """
+    Hashed bag-of-words embeddings: no network, same text always gives the same
+    unit-length vector, and texts sharing words land close to each other.
+    """
+
+    def __init__(self, dim=256):
+        self.dim = dim
+        self.model = f"local/hash-{dim}"
+
+    def _embed(self, text):
+        vector = [0.0] * self.dim
+        for token in _TOKEN_RE.findall(text.lower()):
+            digest = hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest()
+            bucket = int.from_bytes(digest[:4], "little") % self.dim
+            sign = 1.0 if digest[4] & 1 else -1.0
+            vector[bucket] += sign
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return [v / norm for v in vector]
+
+    def embed_documents(self, texts):
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+
+class EchoChatModel(BaseChatModel):
+    """
+    Stub chat model: answers with the first max_words words of the prompt's context,
+    streamed word by word. Lets the QA chain run without network access.
+    """
+
+    max_words: int = 60
+
+    @property
+    def _llm_type(self):
+        return "local-echo"
+
+    def _answer(self, messages):
+        prompt = str(messages[-1].content) if messages else ""
+        if "Context:" not in prompt:
+            # Session summaries and question rewrites: echo the last "Label: text" line
+            for line in reversed(prompt.splitlines()):
+                label, colon, text = line.partition(":")
+                if colon and text.strip():
+                    return " ".join(text.split()[:self.max_words])
+        # The QA prompt puts retrieved context between "Context:" and "Question:"
+        context = prompt.split("Context:", 1)[-1].split("Question:", 1)[0]
+        words = context.split()[:self.max_words]
+        return " ".join(words) if words else "answer is not available in the context"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        message = AIMessage(content=self._answer(messages))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        for i, word in enumerate(self._answer(messages).split(" ")):
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=word if i == 0 else " " + word))
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
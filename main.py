@@ -3,80 +3,61 @@ import streamlit as st
 
 
 import os
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
+import uuid
 import google.generativeai as genai
-from langchain_community.vectorstores import FAISS
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain.chains.question_answering import load_qa_chain
-from langchain.prompts import PromptTemplate
 from dotenv import load_dotenv
-from langchain.memory import ConversationBufferMemory
 
 from document_ingestor import DocumentIngestor
+from multi_index_search import search_indexes
+from embedding_cache import get_cached_embeddings
+from index_manager import IncrementalIndexManager, document_key
+from index_registry import index_version
+from index_store import index_lock
+from instrumentation import log_event, span, start_request
+from rag_core import get_conversational_chain
+from context_assembler import assemble_for_query
+from session_store import get_session_store, prepare_turn, record_turn
 
 #  Load API Key
 load_dotenv()
 genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
 
-def get_conversational_chain(chat_history=None):
-    prompt_template = """
-    Answer the question as possible as concise but full answer., 
-    if the answer is not in provided context just say, "answer is not available in the context",
-    If question in Bengali then give answer in Bengali 
-    don't provide the wrong answer\n\n
-    Context:\n {context}?\n
-    Question: \n{question}\n
-    Answer:
-    """
-    from langchain.chains.combine_documents.stuff import create_stuff_documents_chain
-    model = ChatGoogleGenerativeAI(model="gemini-2.5-flash", temperature=0.2)
-    prompt = PromptTemplate(template=prompt_template, input_variables=["context", "question"])
-    memory = ConversationBufferMemory(memory_key="chat_history", return_messages=True)
-    if chat_history:
-        for msg in chat_history:
-            memory.save_context({"input": msg["question"]}, {"output": msg["answer"]})
-    chain = create_stuff_documents_chain(llm=model, prompt=prompt)
-    return chain
-
-@st.cache_resource(show_spinner=False)
-def get_faiss_index():
-    embeddings = GoogleGenerativeAIEmbeddings(model="models/embedding-001")
-    return FAISS.load_local("faiss_index", embeddings, allow_dangerous_deserialization=True)
+def get_embeddings():
+    # Shared client backed by the persistent embedding cache
+    return get_cached_embeddings()
 
 def user_input(user_question):
-    import os
-    if not os.path.exists("faiss_index") or not os.path.exists(os.path.join("faiss_index", "index.faiss")):
+    if index_version("faiss_index") is None:
         st.error("No FAISS index found. Please upload and process PDF files first.")
         return
-    # Always reload the index after upload
-    st.cache_resource.clear()
-    new_db = get_faiss_index()
-    # Retrieve more top chunks for better context
-    docs = new_db.similarity_search(user_question, k=12)
-    # Filter chunks by keyword if user asks for a specific role
-    keywords = ["internal member", "internal members", "supervisor", "external member", "examiner"]
-    lower_question = user_question.lower()
-    filter_kw = None
-    for kw in keywords:
-        if kw in lower_question:
-            filter_kw = kw
-            break
-    filtered_docs = docs
-    if filter_kw:
-        filtered_docs = [doc for doc in docs if filter_kw in doc.page_content.lower()]
-        # If nothing matches, fall back to all docs
-        if not filtered_docs:
-            filtered_docs = docs
-    # Conversation memory using Streamlit session state
-    if "chat_history" not in st.session_state:
-        st.session_state["chat_history"] = []
-    chain = get_conversational_chain(chat_history=st.session_state["chat_history"])
-    response = chain.invoke({"context": filtered_docs, "question": user_question})
-    print(response)
-    answer = response["output_text"] if isinstance(response, dict) and "output_text" in response else response
-    st.write("Reply: ", answer)
-    # Save to chat history
-    st.session_state["chat_history"].append({"question": user_question, "answer": answer})
+    timings = start_request()
+    # Conversation memory lives in the session store: a bounded window plus a rolling summary
+    if "session_id" not in st.session_state:
+        st.session_state["session_id"] = uuid.uuid4().hex
+    session_id = st.session_state["session_id"]
+    store = get_session_store()
+    history, question = prepare_turn(store, session_id, user_question)
+    if question != user_question:
+        st.caption(f"Searching for: {question}")
+    embeddings = get_embeddings()
+    query_vector = embeddings.embed_query(question)
+    # Vector and BM25 hits fused by reciprocal rank: exact terms (clause numbers, names,
+    # roles like "supervisor") rank high without a keyword list or a wider k
+    docs = [doc for doc, _ in search_indexes(question, ["faiss_index"], embeddings, k=12,
+                                             query_vector=query_vector)]
+    # Overlapping neighbours are merged and near-duplicates dropped before the LLM sees them
+    filtered_docs, context_stats = assemble_for_query(docs, query_vector, embeddings)
+    chain = get_conversational_chain()
+    # Render the reply token by token as the model generates it
+    st.write("Reply: ")
+    with span("query", "llm"):
+        answer = st.write_stream(chain.stream({"context": filtered_docs, "question": question, "history": history}))
+    log_event("query", endpoint="streamlit", chunks=len(filtered_docs), tokens_saved=context_stats["tokens_saved"],
+              timings_ms={stage: round(seconds * 1000, 2) for stage, seconds in timings.items()})
+    if not isinstance(answer, str):
+        answer = "".join(str(part) for part in answer)
+    # Save to the session; turns that leave the window are folded into its summary
+    record_turn(store, session_id, user_question, answer, question)
     st.write("\n**Source Chunks:**")
     for doc in filtered_docs:
         meta = doc.metadata
@@ -84,18 +65,19 @@ def user_input(user_question):
         st.write(f"- File: `{meta.get('filename','?')}` | Chunk: {meta.get('chunk','?')}{page_info}")
         # Show actual chunk text for debugging/clarity
         st.markdown(f"> {doc.page_content[:500]}{' ...' if len(doc.page_content) > 500 else ''}")
-    # Display chat history
+    # Display the recent window only, so rendering cost does not grow with the conversation
+    summary, recent = store.window(session_id)
     st.write("\n**Conversation History:**")
-    for i, msg in enumerate(st.session_state["chat_history"]):
-        st.markdown(f"**Q{i+1}:** {msg['question']}")
-        st.markdown(f"**A{i+1}:** {msg['answer']}")
+    if summary:
+        st.markdown(f"*Earlier:* {summary}")
+    for msg in recent:
+        st.markdown(f"**Q{msg['turn']}:** {msg['question']}")
+        st.markdown(f"**A{msg['turn']}:** {msg['answer']}")
 
 def main():
     import streamlit as st
     from document_ingestor import DocumentIngestor
     from langchain.text_splitter import CharacterTextSplitter
-    from langchain_google_genai import GoogleGenerativeAIEmbeddings
-    from langchain_community.vectorstores import FAISS
     import csv
 
     # Page configuration
@@ -204,10 +186,20 @@ def main():
 
             if processed and text_chunks:
                 try:
-                    embeddings = GoogleGenerativeAIEmbeddings(model="models/embedding-001")
-                    vectorstore = FAISS.from_texts(text_chunks, embedding=embeddings, metadatas=metadatas)
-                    vectorstore.save_local("faiss_index")
-                    st.cache_resource.clear()  # Clear cache for next query reloads 
+                    # Only chunks not already in the embedding cache hit the model
+                    embeddings = get_embeddings()
+                    # Add to the existing index; documents processed again replace their old chunks
+                    by_document = {}
+                    for chunk, meta in zip(text_chunks, metadatas):
+                        texts, metas = by_document.setdefault(document_key(meta), ([], []))
+                        texts.append(chunk)
+                        metas.append(meta)
+                    # Held from load to save so a concurrent writer's documents are not lost
+                    with index_lock("faiss_index"):
+                        manager = IncrementalIndexManager("faiss_index", embeddings)
+                        for key, (texts, metas) in by_document.items():
+                            manager.replace_document(key, texts, metas)
+                        manager.save()
                     st.success(" Successfully processed and indexed your document!")
                 except Exception as e:
                     st.error(f" Something went wrong: {str(e)}")
@@ -0,0 +1,286 @@
+# Model-provider layer: long-lived embedding/chat clients with timeouts, retries and a circuit breaker
+import asyncio
+import importlib
+import os
+import random
+import threading
+import time
+from typing import Any
+
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from instrumentation import count
+
+# "google", "local" (deterministic offline models, see local_models.py) or "module:factory"
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "google")
+LLM_BACKEND = os.getenv("LLM_BACKEND", "google")
+CHAT_MODEL = os.getenv("CHAT_MODEL", "gemini-2.5-flash")
+MODEL_TIMEOUT = float(os.getenv("MODEL_TIMEOUT", "60"))
+MODEL_MAX_RETRIES = int(os.getenv("MODEL_MAX_RETRIES", "3"))
+MODEL_BACKOFF_BASE = float(os.getenv("MODEL_BACKOFF_BASE", "0.5"))
+MODEL_BACKOFF_MAX = float(os.getenv("MODEL_BACKOFF_MAX", "10"))
+# Consecutive failures that open the circuit, and how long it stays open
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_SECONDS = float(os.getenv("CIRCUIT_RESET_SECONDS", "30"))
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+# Caller mistakes: retrying them cannot help and they say nothing about the provider's health
+NON_RETRYABLE = (CircuitOpenError, TypeError, ValueError)
+
+
+class CircuitBreaker:
+    """
+    Fails fast after failure_threshold consecutive failures. After reset_seconds
+    one trial call is let through; its outcome closes or re-opens the circuit.
+    """
+
+    def __init__(self, name, failure_threshold=CIRCUIT_FAILURE_THRESHOLD, reset_seconds=CIRCUIT_RESET_SECONDS):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self.opened_at is None:
+                return "closed"
+            if time.monotonic() - self.opened_at >= self.reset_seconds:
+                return "half_open"
+            return "open"
+
+    def before_call(self):
+        with self._lock:
+            if self.opened_at is None:
+                return
+            if time.monotonic() - self.opened_at >= self.reset_seconds and not self._trial_running:
+                self._trial_running = True
+                return
+        count("rag_model_circuit_rejections_total", client=self.name)
+        raise CircuitOpenError(f"{self.name} circuit is open after {self.failures} consecutive failures.")
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_running = False
+
+    def release_trial(self):
+        # A trial call that ended without a verdict (caller mistake, cancellation) frees the slot for the next one
+        with self._lock:
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_running = False
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+def backoff_delay(attempt, base=MODEL_BACKOFF_BASE, maximum=MODEL_BACKOFF_MAX):
+    # Exponential backoff with jitter so concurrent callers do not retry in lockstep
+    return min(maximum, base * 2 ** (attempt - 1)) * random.uniform(0.5, 1.0)
+
+
+def call_with_retries(breaker, fn, *args, max_retries=MODEL_MAX_RETRIES, **kwargs):
+    attempt = 0
+    while True:
+        breaker.before_call()
+        try:
+            result = fn(*args, **kwargs)
+        except NON_RETRYABLE:
+            breaker.release_trial()
+            raise
+        except Exception:
+            breaker.record_failure()
+            attempt += 1
+            if attempt > max_retries:
+                raise
+            count("rag_model_retries_total", client=breaker.name)
+            time.sleep(backoff_delay(attempt))
+        except BaseException:
+            breaker.release_trial()
+            raise
+        else:
+            breaker.record_success()
+            return result
+
+
+async def acall_with_retries(breaker, fn, *args, max_retries=MODEL_MAX_RETRIES, **kwargs):
+    attempt = 0
+    while True:
+        breaker.before_call()
+        try:
+            result = await fn(*args, **kwargs)
+        except NON_RETRYABLE:
+            breaker.release_trial()
+            raise
+        except Exception:
+            breaker.record_failure()
+            attempt += 1
+            if attempt > max_retries:
+                raise
+            count("rag_model_retries_total", client=breaker.name)
+            await asyncio.sleep(backoff_delay(attempt))
+        except BaseException:
+            breaker.release_trial()
+            raise
+        else:
+            breaker.record_success()
+            return result
+
+
+class ResilientEmbeddings(Embeddings):
+    """
+    Wraps an embedding client with retries and a circuit breaker. Keeps the
+    wrapped model's name so cached vectors stay valid.
+    """
+
+    def __init__(self, underlying, breaker=None):
+        self.underlying = underlying
+        self.model = getattr(underlying, "model", None) or type(underlying).__name__
+        self.breaker = breaker or CircuitBreaker("embedding")
+
+    def embed_documents(self, texts, **kwargs):
+        return call_with_retries(self.breaker, self.underlying.embed_documents, texts, **kwargs)
+
+    def embed_query(self, text):
+        return call_with_retries(self.breaker, self.underlying.embed_query, text)
+
+
+class ResilientChatModel(BaseChatModel):
+    """
+    Wraps a chat model with retries and a circuit breaker. Streams are retried
+    only until the first chunk arrives, so callers never see a token twice.
+    """
+
+    inner: Any
+    breaker: Any
+    max_retries: int = MODEL_MAX_RETRIES
+
+    @property
+    def _llm_type(self):
+        return f"resilient-{getattr(self.inner, '_llm_type', 'chat')}"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        message = call_with_retries(
+            self.breaker, self.inner.invoke, messages, stop=stop, max_retries=self.max_retries, **kwargs
+        )
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        message = await acall_with_retries(
+            self.breaker, self.inner.ainvoke, messages, stop=stop, max_retries=self.max_retries, **kwargs
+        )
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        def first_chunk():
+            stream = iter(self.inner.stream(messages, stop=stop, **kwargs))
+            return stream, next(stream, None)
+
+        stream, first = call_with_retries(self.breaker, first_chunk, max_retries=self.max_retries)
+        if first is None:
+            return
+        for message_chunk in _chain_first(first, stream):
+            chunk = ChatGenerationChunk(message=message_chunk)
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        async def first_chunk():
+            stream = self.inner.astream(messages, stop=stop, **kwargs).__aiter__()
+            try:
+                return stream, await stream.__anext__()
+            except StopAsyncIteration:
+                return stream, None
+
+        stream, first = await acall_with_retries(self.breaker, first_chunk, max_retries=self.max_retries)
+        if first is None:
+            return
+        message_chunk = first
+        while True:
+            chunk = ChatGenerationChunk(message=message_chunk)
+            if run_manager:
+                await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+            try:
+                message_chunk = await stream.__anext__()
+            except StopAsyncIteration:
+                return
+
+
+def _chain_first(first, rest):
+    yield first
+    yield from rest
+
+
+def _load_factory(spec):
+    # "package.module:function" -> the function
+    module_name, _, attr = spec.partition(":")
+    return getattr(importlib.import_module(module_name), attr)
+
+
+def _build_embeddings(model):
+    if EMBEDDING_BACKEND == "local":
+        from local_models import HashEmbeddings
+        return HashEmbeddings()
+    if ":" in EMBEDDING_BACKEND:
+        return _load_factory(EMBEDDING_BACKEND)(model)
+    from langchain_google_genai import GoogleGenerativeAIEmbeddings
+    return GoogleGenerativeAIEmbeddings(model=model, request_options={"timeout": MODEL_TIMEOUT})
+
+
+def _build_chat_model():
+    if LLM_BACKEND == "local":
+        from local_models import EchoChatModel
+        return EchoChatModel()
+    if ":" in LLM_BACKEND:
+        return _load_factory(LLM_BACKEND)()
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    # Retries are handled here, not by the client, so the circuit breaker sees every failure
+    return ChatGoogleGenerativeAI(model=CHAT_MODEL, temperature=0.2, timeout=MODEL_TIMEOUT, max_retries=1)
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_embedding_client(model="models/embedding-001"):
+    """
+    Returns the process-wide embedding client for model. It is created once, so
+    its HTTP/gRPC connections are kept alive and reused across requests.
+    """
+    key = ("embedding", model)
+    with _clients_lock:
+        if key not in _clients:
+            _clients[key] = ResilientEmbeddings(_build_embeddings(model))
+        return _clients[key]
+
+
+def get_chat_model():
+    """
+    Returns the process-wide chat model client.
+    """
+    key = ("chat", CHAT_MODEL)
+    with _clients_lock:
+        if key not in _clients:
+            _clients[key] = ResilientChatModel(inner=_build_chat_model(), breaker=CircuitBreaker("chat"))
+        return _clients[key]
+
+
+def breaker_states():
+    # (client name, state) for every client created so far; exported by /metrics
+    with _clients_lock:
+        return [(client.breaker.name, client.breaker.state) for client in _clients.values()]
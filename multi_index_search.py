@@ -0,0 +1,276 @@
+# Search several per-file FAISS indexes at once and merge hits into one global top-k,
+# fused with BM25 hits by reciprocal rank
+import heapq
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from langchain_community.vectorstores.utils import DistanceStrategy
+
+from ann_index import search_parameters
+from index_registry import get_index, index_version
+from index_store import index_lock, is_generation_dir
+from instrumentation import count, log_event, run_in_context, span
+from lexical_index import HYBRID_SEARCH, reciprocal_rank_fusion
+
+# Name of the optional single index holding the chunks of every uploaded file
+CORPUS_INDEX = "_corpus"
+MERGED_CORPUS_INDEX = os.getenv("MERGED_CORPUS_INDEX", "0") == "1"
+
+# FAISS releases the GIL while searching, so threads search indexes in parallel
+_executor = ThreadPoolExecutor(max_workers=int(os.getenv("SEARCH_WORKERS", "8")))
+_corpus_lock = threading.Lock()
+
+
+def _ranked(db, query_vector, k, positions=None, nprobe=None, ef_search=None):
+    """
+    Runs one index search and returns (sort_key, doc, score) tuples, best first.
+    The sort key is "lower is better" regardless of the index distance strategy.
+    """
+    return _batch_ranked(db, [query_vector], k, positions=positions, nprobe=nprobe, ef_search=ef_search)[0]
+
+
+def _lexical_ranked(db, question, k, file_ids=None):
+    """
+    BM25 hits of the index's lexical index in the same form as _ranked();
+    empty when hybrid search is off or the index has no lexical index.
+    """
+    lexical_index = getattr(db, "lexical_index", None)
+    if not HYBRID_SEARCH or lexical_index is None or not question:
+        return []
+    keep = None
+    if file_ids:
+        wanted = set(file_ids)
+        keep = lambda doc_id: db.docstore.search(doc_id).metadata.get("file_id") in wanted  # noqa: E731
+    with span("query", "lexical"):
+        hits = lexical_index.search(question, k, keep)
+    return [(-score, db.docstore.search(doc_id), score) for doc_id, score in hits]
+
+
+def _search_failed(path, error):
+    # One broken index should not fail the whole query, but it must not go unnoticed either
+    count("rag_search_failures_total", error=type(error).__name__)
+    log_event("search_failed", index=os.path.basename(path), error=repr(error))
+
+
+def _fuse(vector_lists, lexical_lists, k):
+    # Global vector top-k and global BM25 top-k, combined by reciprocal rank
+    vector_hits = merge_top_k(vector_lists, k)
+    if not any(lexical_lists):
+        return vector_hits
+    return reciprocal_rank_fusion([vector_hits, merge_top_k(lexical_lists, k)], k)
+
+
+def merge_top_k(ranked_lists, k):
+    """
+    Heap-merges per-index result lists (each already sorted best first) and
+    returns the global best k as (doc, score) pairs.
+    """
+    merged = heapq.merge(*ranked_lists, key=lambda item: item[0])
+    return [(doc, score) for _, doc, score in islice(merged, k)]
+
+
+def file_positions(db):
+    """
+    Maps each file_id in the index to the FAISS positions of its chunks. Built
+    once per loaded generation and kept on the store, like its lexical index.
+    """
+    positions = getattr(db, "file_positions", None)
+    if positions is None:
+        import numpy as np
+
+        by_file = {}
+        for position, doc_id in db.index_to_docstore_id.items():
+            file_id = db.docstore.search(doc_id).metadata.get("file_id")
+            by_file.setdefault(file_id, []).append(position)
+        positions = {file_id: np.array(p, dtype=np.int64) for file_id, p in by_file.items()}
+        db.file_positions = positions
+    return positions
+
+
+def _search_index(path, embeddings, query_vectors, questions, k, nprobe=None, ef_search=None,
+                  file_ids=None, db=None):
+    """
+    Searches one index with every query vector and returns (vector ranked lists,
+    BM25 ranked lists), one of each per query. With file_ids, only chunks of
+    those files are searched. A missing or broken index returns no hits.
+    """
+    empty = [[] for _ in query_vectors]
+    try:
+        if db is None:
+            with span("query", "load"):
+                db = get_index(path, embeddings)
+        positions = None
+        if file_ids is not None:
+            by_file = file_positions(db)
+            wanted = [by_file[fid] for fid in file_ids if fid in by_file]
+            if not wanted:
+                return empty, empty
+            import numpy as np
+
+            positions = np.concatenate(wanted)
+        with span("query", "search"):
+            vector_ranked = _batch_ranked(db, query_vectors, k, positions=positions, nprobe=nprobe,
+                                          ef_search=ef_search)
+        return vector_ranked, [_lexical_ranked(db, question, k, file_ids) for question in questions]
+    except FileNotFoundError:
+        # Deleted since the caller listed it
+        return empty, empty
+    except Exception as e:
+        _search_failed(path, e)
+        return empty, empty
+
+
+def _merge_per_query(per_index, queries, k):
+    # per_index holds one (vector ranked lists, BM25 ranked lists) pair per searched index
+    with span("query", "merge"):
+        return [
+            _fuse([vector[i] for vector, _ in per_index], [lexical[i] for _, lexical in per_index], k)
+            for i in range(queries)
+        ]
+
+
+def search_indexes(question, index_paths, embeddings, k=10, query_vector=None, nprobe=None, ef_search=None):
+    """
+    Embeds the question once, searches every index in parallel and returns the
+    global top-k (doc, score) pairs across all of them, fused with the BM25 top-k.
+    nprobe (IVF) and ef_search (HNSW) override the index defaults for this query.
+    """
+    if query_vector is None:
+        with span("query", "embed"):
+            query_vector = embeddings.embed_query(question)
+    return batch_search_indexes([query_vector], index_paths, embeddings, k=k, nprobe=nprobe, ef_search=ef_search,
+                                questions=[question])[0]
+
+
+def _batch_ranked(db, query_vectors, k, positions=None, nprobe=None, ef_search=None):
+    """
+    One matrix search over all query vectors; returns a ranked list per query in
+    the same form as _ranked(). With positions, an ID selector limits the search
+    to those FAISS positions.
+    """
+    import faiss
+    import numpy as np
+
+    vectors = np.array(query_vectors, dtype=np.float32)
+    if getattr(db, "_normalize_L2", False):
+        faiss.normalize_L2(vectors)
+    selector = None if positions is None else faiss.IDSelectorBatch(positions)
+    params = search_parameters(db.index, nprobe=nprobe, ef_search=ef_search, selector=selector)
+    if params is None:
+        scores, positions = db.index.search(vectors, k)
+    else:
+        scores, positions = db.index.search(vectors, k, params=params)
+    higher_is_better = db.distance_strategy in (
+        DistanceStrategy.MAX_INNER_PRODUCT,
+        DistanceStrategy.JACCARD,
+    )
+    ranked_per_query = []
+    for row_scores, row_positions in zip(scores, positions):
+        ranked = []
+        for score, position in zip(row_scores, row_positions):
+            if position == -1:
+                continue
+            doc = db.docstore.search(db.index_to_docstore_id[int(position)])
+            score = float(score)
+            ranked.append(((-score if higher_is_better else score), doc, score))
+        ranked.sort(key=lambda item: item[0])
+        ranked_per_query.append(ranked)
+    return ranked_per_query
+
+
+def batch_search_indexes(query_vectors, index_paths, embeddings, k=10, nprobe=None, ef_search=None, questions=None):
+    """
+    Searches every index once with the whole matrix of query vectors (in parallel
+    across indexes) and returns the global top-k (doc, score) pairs per query.
+    With questions, each query is also fused with its BM25 hits.
+    """
+    questions = questions or [None] * len(query_vectors)
+    futures = [
+        run_in_context(_executor, _search_index, path, embeddings, query_vectors, questions, k, nprobe, ef_search)
+        for path in index_paths
+    ]
+    return _merge_per_query([future.result() for future in futures], len(query_vectors), k)
+
+
+def batch_search_corpus(query_vectors, index_dir, embeddings, file_ids, k=10, nprobe=None, ef_search=None,
+                        questions=None):
+    """
+    Searches the merged corpus index restricted to the chunks of file_ids and, in
+    parallel, the per-file indexes of those file_ids the corpus does not hold
+    (uploaded before it existed). Returns the global top-k (doc, score) pairs per query.
+    """
+    questions = questions or [None] * len(query_vectors)
+    corpus_path = os.path.join(index_dir, CORPUS_INDEX)
+    try:
+        with span("query", "load"):
+            db = get_index(corpus_path, embeddings)
+        in_corpus = file_positions(db)
+    except FileNotFoundError:
+        db, in_corpus = None, {}
+    corpus_ids = [fid for fid in file_ids if fid in in_corpus]
+    futures = [
+        run_in_context(_executor, _search_index, os.path.join(index_dir, fid), embeddings, query_vectors,
+                       questions, k, nprobe, ef_search)
+        for fid in file_ids if fid not in in_corpus
+    ]
+    if corpus_ids:
+        # No selector when every file in the corpus was asked for
+        selected = corpus_ids if len(set(corpus_ids)) < len(in_corpus) else None
+        futures.append(run_in_context(_executor, _search_index, corpus_path, embeddings, query_vectors,
+                                      questions, k, nprobe, ef_search, selected, db))
+    return _merge_per_query([future.result() for future in futures], len(query_vectors), k)
+
+
+def search_corpus(question, index_dir, embeddings, file_ids, k=10, query_vector=None, nprobe=None, ef_search=None):
+    """
+    Single-question form of batch_search_corpus().
+    """
+    if query_vector is None:
+        with span("query", "embed"):
+            query_vector = embeddings.embed_query(question)
+    return batch_search_corpus([query_vector], index_dir, embeddings, file_ids, k=k, nprobe=nprobe,
+                               ef_search=ef_search, questions=[question])[0]
+
+
+def add_to_corpus(vectorstore, file_id, index_dir, embeddings):
+    """
+    Replaces the chunks of file_id in the merged corpus index with those of vectorstore.
+    """
+    from index_manager import IncrementalIndexManager
+
+    corpus_path = os.path.join(index_dir, CORPUS_INDEX)
+    # The file lock makes the read-modify-write safe against other worker processes
+    with _corpus_lock, index_lock(corpus_path):
+        manager = IncrementalIndexManager(corpus_path, embeddings)
+        manager.replace_vectorstore(file_id, vectorstore)
+        manager.save()
+
+
+def remove_from_corpus(file_id, index_dir, embeddings):
+    """
+    Deletes the chunks of file_id from the merged corpus index, if there is one.
+    """
+    from index_manager import IncrementalIndexManager
+
+    corpus_path = os.path.join(index_dir, CORPUS_INDEX)
+    if index_version(corpus_path) is None:
+        return 0
+    with _corpus_lock, index_lock(corpus_path):
+        manager = IncrementalIndexManager(corpus_path, embeddings)
+        removed = manager.delete_document(file_id)
+        if removed:
+            manager.save()
+        return removed
+
+
+def list_file_ids(index_dir):
+    if not os.path.isdir(index_dir):
+        return []
+    # Skips generation directories (index_dir can be an index itself) and deleted indexes
+    return [
+        d for d in os.listdir(index_dir)
+        if d != CORPUS_INDEX and not is_generation_dir(d)
+        and os.path.isdir(os.path.join(index_dir, d)) and index_version(os.path.join(index_dir, d)) is not None
+    ]
@@ -0,0 +1,170 @@
+# OCR subsystem: tesseract worker pool, content-hash result cache and image preprocessing
+import hashlib
+import io
+import multiprocessing
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor
+
+# Half the CPUs by default: the ingestion pool (INGEST_PROCESS_WORKERS) gets the other half.
+# 0 runs OCR inline in the calling process, as ingestion workers do
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+OCR_CACHE_DIR = os.getenv("OCR_CACHE_DIR", "ocr_cache")
+OCR_MEMORY_CACHE_SIZE = 256
+# Longest image side in pixels before OCR; larger images are downscaled
+OCR_MAX_SIDE = int(os.getenv("OCR_MAX_SIDE", "3000"))
+PDF_OCR_RESOLUTION = int(os.getenv("PDF_OCR_RESOLUTION", "200"))
+
+_pool = None
+_pool_lock = threading.Lock()
+_memory_cache = OrderedDict()
+_memory_lock = threading.Lock()
+
+
+def _submit(fn, *args):
+    # Future for fn(*args): from the worker pool, or already finished when OCR runs inline
+    if OCR_WORKERS <= 0:
+        future = Future()
+        try:
+            future.set_result(fn(*args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=OCR_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pool.submit(fn, *args)
+
+
+def preprocess(image):
+    """
+    Grayscale, downscale to OCR_MAX_SIDE and stretch contrast: faster tesseract
+    runs and usually better recognition on screenshots and scans.
+    """
+    from PIL import ImageOps
+
+    image = ImageOps.exif_transpose(image)
+    image = image.convert("L")
+    longest = max(image.size)
+    if longest > OCR_MAX_SIDE:
+        scale = OCR_MAX_SIDE / longest
+        image = image.resize((max(1, int(image.width * scale)), max(1, int(image.height * scale))))
+    return ImageOps.autocontrast(image)
+
+
+def _ocr_image_bytes(data):
+    # Runs in a worker process, or inline with OCR_WORKERS=0
+    import pytesseract
+    from PIL import Image
+
+    return pytesseract.image_to_string(preprocess(Image.open(io.BytesIO(data))))
+
+
+def _ocr_pdf_page(file_path, page_index, resolution):
+    # Runs in a worker process (or inline): render one page with its own PDF handle, then OCR it
+    import pdfplumber
+    import pytesseract
+
+    with pdfplumber.open(file_path) as pdf:
+        image = pdf.pages[page_index].to_image(resolution=resolution).original
+    return pytesseract.image_to_string(preprocess(image))
+
+
+def _cache_get(key):
+    with _memory_lock:
+        if key in _memory_cache:
+            _memory_cache.move_to_end(key)
+            return _memory_cache[key]
+    path = os.path.join(OCR_CACHE_DIR, f"{key}.txt")
+    try:
+        with open(path, encoding="utf-8") as f:
+            text = f.read()
+    except OSError:
+        return None
+    _memory_put(key, text)
+    return text
+
+
+def _memory_put(key, text):
+    with _memory_lock:
+        _memory_cache[key] = text
+        while len(_memory_cache) > OCR_MEMORY_CACHE_SIZE:
+            _memory_cache.popitem(last=False)
+
+
+def _cache_put(key, text):
+    _memory_put(key, text)
+    # Unique per call: threads of one process may write the same image at once
+    tmp_path = os.path.join(OCR_CACHE_DIR, f".{key}.{uuid.uuid4().hex}.tmp")
+    try:
+        os.makedirs(OCR_CACHE_DIR, exist_ok=True)
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_path, os.path.join(OCR_CACHE_DIR, f"{key}.txt"))
+    except OSError:
+        # The disk cache is only an optimization; the OCR text is still returned
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+
+
+def image_key(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def ocr_image_bytes(data):
+    """
+    OCRs encoded image bytes in the worker pool; identical images hit the cache.
+    """
+    key = image_key(data)
+    text = _cache_get(key)
+    if text is None:
+        text = _submit(_ocr_image_bytes, data).result()
+        _cache_put(key, text)
+    return text
+
+
+def ocr_image_file(file_path):
+    with open(file_path, "rb") as f:
+        return ocr_image_bytes(f.read())
+
+
+def hash_file(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def ocr_pdf_pages(file_path, page_numbers, resolution=PDF_OCR_RESOLUTION, file_hash=None):
+    """
+    OCRs the given 1-based PDF pages in parallel and returns {page_number: text}.
+    Results are cached per (file content, page, resolution).
+    """
+    if not page_numbers:
+        return {}
+    file_hash = file_hash or hash_file(file_path)
+    results = {}
+    futures = {}
+    for page_num in page_numbers:
+        key = hashlib.sha256(f"{file_hash}:{page_num}:{resolution}".encode()).hexdigest()
+        text = _cache_get(key)
+        if text is not None:
+            results[page_num] = text
+        else:
+            futures[page_num] = (key, _submit(_ocr_pdf_page, file_path, page_num - 1, resolution))
+    for page_num, (key, future) in futures.items():
+        try:
+            text = future.result()
+        except Exception:
+            # No tesseract or an unrenderable page: keep the page empty rather than fail the document
+            text = ""
+        else:
+            _cache_put(key, text)
+        results[page_num] = text
+    return results
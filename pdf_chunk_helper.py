@@ -1,20 +1,140 @@
 # Helper to extract text chunks with page numbers from PDF
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
 import pdfplumber
 
-def extract_pdf_chunks_with_page_numbers(file_path, chunk_size=4000, chunk_overlap=300):
+PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", str(os.cpu_count() or 1)))
+# "pdfplumber" (default), or the faster "pymupdf" / "pypdfium2" for text-layer pages
+PDF_BACKEND = os.getenv("PDF_BACKEND", "pdfplumber")
+PAGES_PER_TASK = 16
+# OCR pages whose text layer is empty (scanned PDFs)
+PDF_OCR_FALLBACK = os.getenv("PDF_OCR_FALLBACK", "1") == "1"
+
+
+def _chunk_page(text, page_num, chunk_size, chunk_overlap):
+    chunks = []
+    step = max(1, chunk_size - chunk_overlap)
+    start = 0
+    while start < len(text):
+        end = min(start + chunk_size, len(text))
+        chunk = text[start:end]
+        if chunk.strip():
+            chunks.append((chunk, page_num))
+        start += step
+    return chunks
+
+
+def _page_count(file_path):
+    with pdfplumber.open(file_path) as pdf:
+        return len(pdf.pages)
+
+
+def _iter_page_texts(file_path, start, end, backend):
     """
-    Extracts text from a PDF and returns a list of (chunk, page_number) tuples.
+    Yields (page_number, text) for pages start..end-1 (0-based) using its own file handle.
+    Pages where a fast backend finds no text are retried with pdfplumber.
     """
+    empty = []
+    if backend == "pymupdf":
+        import fitz
+        with fitz.open(file_path) as doc:
+            for i in range(start, end):
+                text = doc[i].get_text() or ""
+                if text.strip():
+                    yield i + 1, text
+                else:
+                    empty.append(i)
+    elif backend == "pypdfium2":
+        import pypdfium2 as pdfium
+        doc = pdfium.PdfDocument(file_path)
+        try:
+            for i in range(start, end):
+                page = doc[i]
+                textpage = page.get_textpage()
+                text = textpage.get_text_range() or ""
+                textpage.close()
+                page.close()
+                if text.strip():
+                    yield i + 1, text
+                else:
+                    empty.append(i)
+        finally:
+            doc.close()
+    else:
+        empty = range(start, end)
+    if empty:
+        with pdfplumber.open(file_path) as pdf:
+            for i in empty:
+                yield i + 1, pdf.pages[i].extract_text() or ""
+
+
+def _extract_page_range(file_path, start, end, backend):
+    return sorted(_iter_page_texts(file_path, start, end, backend))
+
+
+def _chunk_range(file_path, page_texts, chunk_size, chunk_overlap, ocr_fallback, file_hash):
+    """
+    Chunks one range of (page_number, text); pages without a text layer are OCRed in parallel first.
+    """
+    empty = [page_num for page_num, text in page_texts if not text.strip()]
+    ocr_texts = {}
+    if empty and ocr_fallback:
+        from ocr import ocr_pdf_pages
+        ocr_texts = ocr_pdf_pages(file_path, empty, file_hash=file_hash)
     chunks = []
-    with pdfplumber.open(file_path) as pdf:
-        for page_num, page in enumerate(pdf.pages, start=1):
-            text = page.extract_text() or ""
-            # Split page text into chunks
-            start = 0
-            while start < len(text):
-                end = min(start + chunk_size, len(text))
-                chunk = text[start:end]
-                if chunk.strip():
-                    chunks.append((chunk, page_num))
-                start += chunk_size - chunk_overlap
+    for page_num, text in page_texts:
+        text = ocr_texts.get(page_num, text)
+        chunks.extend(_chunk_page(text, page_num, chunk_size, chunk_overlap))
     return chunks
+
+
+def iter_pdf_chunks_with_page_numbers(file_path, chunk_size=4000, chunk_overlap=300,
+                                      workers=None, backend=None, pages_per_task=PAGES_PER_TASK,
+                                      ocr_fallback=None):
+    """
+    Yields (chunk, page_number) tuples in page order.
+    Large PDFs are split into page ranges extracted in parallel worker processes,
+    each with its own PDF handle; earlier ranges are yielded while later ones are parsed.
+    Scanned pages with no text layer are OCRed unless ocr_fallback is False.
+    """
+    workers = PDF_EXTRACT_WORKERS if workers is None else workers
+    backend = backend or PDF_BACKEND
+    ocr_fallback = PDF_OCR_FALLBACK if ocr_fallback is None else ocr_fallback
+    page_count = _page_count(file_path)
+    ranges = [(s, min(s + pages_per_task, page_count)) for s in range(0, page_count, pages_per_task)]
+    # Hash once per file for the OCR cache, only if a page actually needs OCR
+    file_hash = None
+
+    def chunk_range(page_texts):
+        nonlocal file_hash
+        if ocr_fallback and file_hash is None and any(not text.strip() for _, text in page_texts):
+            from ocr import hash_file
+            file_hash = hash_file(file_path)
+        return _chunk_range(file_path, page_texts, chunk_size, chunk_overlap, ocr_fallback, file_hash)
+
+    if workers <= 1 or len(ranges) <= 1:
+        for start, end in ranges:
+            yield from chunk_range(_extract_page_range(file_path, start, end, backend))
+        return
+    # spawn: the caller may be the API process, and forking a process that already runs threads can deadlock
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=min(workers, len(ranges)), mp_context=context) as pool:
+        # Keep a bounded number of ranges in flight so memory does not grow with page count
+        in_flight = []
+        next_range = 0
+        while next_range < len(ranges) or in_flight:
+            while next_range < len(ranges) and len(in_flight) < workers * 2:
+                start, end = ranges[next_range]
+                in_flight.append(pool.submit(_extract_page_range, file_path, start, end, backend))
+                next_range += 1
+            yield from chunk_range(in_flight.pop(0).result())
+
+
+def extract_pdf_chunks_with_page_numbers(file_path, chunk_size=4000, chunk_overlap=300,
+                                         workers=None, backend=None):
+    """
+    Extracts text from a PDF and returns a list of (chunk, page_number) tuples.
+    """
+    return list(iter_pdf_chunks_with_page_numbers(file_path, chunk_size, chunk_overlap, workers, backend))
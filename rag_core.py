@@ -0,0 +1,37 @@
+# Shared RAG core for the API and the Streamlit app: prompt and QA chain, no UI dependencies
+from dotenv import load_dotenv
+
+from model_providers import get_chat_model
+
+# GOOGLE_API_KEY is read from .env by the Gemini clients
+load_dotenv()
+
+PROMPT_TEMPLATE = """
+    Answer the question as possible as concise but full answer., 
+    if the answer is not in provided context just say, "answer is not available in the context",
+    If question in Bengali then give answer in Bengali 
+    don't provide the wrong answer\n\n
+    Conversation so far:\n {history}\n
+    Context:\n {context}?\n
+    Question: \n{question}\n
+    Answer:
+    """
+
+_chain = None
+
+
+def get_conversational_chain():
+    """
+    The shared QA chain. Inputs: context (documents), question and, for session
+    queries, history (session_store.format_history) which defaults to empty.
+    """
+    global _chain
+    if _chain is None:
+        from langchain.chains.combine_documents.stuff import create_stuff_documents_chain
+        from langchain.prompts import PromptTemplate
+
+        # Built once: the chat client is pooled (LLM_BACKEND=local for the offline stand-in)
+        prompt = PromptTemplate(template=PROMPT_TEMPLATE, input_variables=["context", "question"],
+                                partial_variables={"history": ""})
+        _chain = create_stuff_documents_chain(llm=get_chat_model(), prompt=prompt)
+    return _chain
@@ -0,0 +1,230 @@
+# Server-side conversation sessions: SQLite history, a token-bounded window and a rolling summary
+import os
+import sqlite3
+import threading
+import time
+
+from embedding_scheduler import estimate_tokens
+from instrumentation import count, span
+from model_providers import get_chat_model
+
+SESSION_DB_PATH = os.getenv("SESSION_DB_PATH", "sessions.sqlite3")
+# Most (approximate) tokens of recent turns sent verbatim; older turns are folded into the summary
+SESSION_HISTORY_TOKENS = int(os.getenv("SESSION_HISTORY_TOKENS", "600"))
+SESSION_SUMMARY_TOKENS = int(os.getenv("SESSION_SUMMARY_TOKENS", "250"))
+# Rewrite follow-up questions into standalone ones before retrieval
+SESSION_REWRITE = os.getenv("SESSION_REWRITE", "1") == "1"
+
+SUMMARY_PROMPT = """
+    Update the summary of a conversation about some documents with the new turns below.
+    Keep names, numbers and facts the user may refer back to. Use at most {words} words.
+    If the conversation is in Bengali then write the summary in Bengali.\n\n
+    Summary so far:\n{summary}\n
+    New turns:\n{turns}\n
+    Updated summary:
+    """
+
+REWRITE_PROMPT = """
+    Rewrite the follow-up question as a standalone question that can be understood
+    without the conversation. Resolve pronouns and references, keep the language of
+    the question, and return only the question.\n\n
+    Conversation:\n{history}\n
+    Follow-up question: {question}\n
+    Standalone question:
+    """
+
+
+def _clip(text, tokens):
+    # Inverse of estimate_tokens (~4 characters per token)
+    return text if estimate_tokens(text) <= tokens else text[:tokens * 4].rstrip() + " ..."
+
+
+def _format_turns(turns):
+    return "\n".join(f"Q: {turn['question']}\nA: {turn['answer']}" for turn in turns)
+
+
+def format_history(summary, turns):
+    """
+    History text for prompts: the rolling summary, then the recent turns verbatim.
+    """
+    parts = []
+    if summary:
+        parts.append(f"Summary of earlier conversation: {summary}")
+    if turns:
+        parts.append(_format_turns(turns))
+    return "\n".join(parts)
+
+
+class SessionStore:
+    """
+    Conversation turns per session_id in SQLite. window() returns the rolling
+    summary plus the newest turns that fit max_tokens; compact() folds the turns
+    that fell out of the window into the summary, so prompts stay the same size
+    however long a conversation runs. All turns stay on disk.
+    """
+
+    def __init__(self, path=SESSION_DB_PATH, max_tokens=SESSION_HISTORY_TOKENS):
+        self.path = path
+        self.max_tokens = max_tokens
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "session_id TEXT PRIMARY KEY, summary TEXT NOT NULL DEFAULT '', "
+            "summarized_through INTEGER NOT NULL DEFAULT 0, updated REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS turns ("
+            "session_id TEXT NOT NULL, turn INTEGER NOT NULL, question TEXT NOT NULL, "
+            "standalone TEXT, answer TEXT NOT NULL, tokens INTEGER NOT NULL, created REAL NOT NULL, "
+            "PRIMARY KEY (session_id, turn))"
+        )
+        self._conn.commit()
+
+    def _state(self, session_id):
+        # (summary, summarized_through, unsummarized turns oldest first); caller holds the lock
+        row = self._conn.execute(
+            "SELECT summary, summarized_through FROM sessions WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        summary, through = row if row else ("", 0)
+        rows = self._conn.execute(
+            "SELECT turn, question, answer, tokens FROM turns WHERE session_id = ? AND turn > ? ORDER BY turn",
+            (session_id, through),
+        ).fetchall()
+        turns = [{"turn": t, "question": q, "answer": a, "tokens": n} for t, q, a, n in rows]
+        return summary, through, turns
+
+    def _split(self, turns):
+        # Index of the first turn in the window: the newest turns within max_tokens, at least one
+        total = 0
+        start = len(turns)
+        while start > 0 and (start == len(turns) or total + turns[start - 1]["tokens"] <= self.max_tokens):
+            total += turns[start - 1]["tokens"]
+            start -= 1
+        return start
+
+    def window(self, session_id):
+        """
+        Returns (summary, turns): the rolling summary and the recent turns that fit
+        the token window, oldest first. An oversized newest turn is clipped.
+        """
+        with self._lock:
+            summary, _, turns = self._state(session_id)
+        turns = turns[self._split(turns):]
+        if turns and turns[-1]["tokens"] > self.max_tokens:
+            turns[-1] = dict(turns[-1], answer=_clip(turns[-1]["answer"], self.max_tokens // 2),
+                             question=_clip(turns[-1]["question"], self.max_tokens // 2))
+        return summary, turns
+
+    def append(self, session_id, question, answer, standalone=None):
+        # standalone: the rewritten question, kept only when it differs from the asked one
+        standalone = standalone if standalone != question else None
+        tokens = estimate_tokens(question) + estimate_tokens(answer)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO sessions (session_id, updated) VALUES (?, ?) "
+                "ON CONFLICT(session_id) DO UPDATE SET updated = excluded.updated",
+                (session_id, now),
+            )
+            self._conn.execute(
+                "INSERT INTO turns (session_id, turn, question, standalone, answer, tokens, created) "
+                "SELECT ?, COALESCE(MAX(turn), 0) + 1, ?, ?, ?, ?, ? FROM turns WHERE session_id = ?",
+                (session_id, question, standalone, answer, tokens, now, session_id),
+            )
+            self._conn.commit()
+
+    def compact(self, session_id, summarize=None):
+        """
+        Folds unsummarized turns older than the window into the rolling summary.
+        The LLM call runs without the lock; if another compaction got there first
+        its result is kept. Returns the number of turns folded.
+        """
+        summarize = summarize or summarize_history
+        with self._lock:
+            summary, through, turns = self._state(session_id)
+        overflow = turns[:self._split(turns)]
+        if not overflow:
+            return 0
+        try:
+            new_summary = summarize(summary, overflow)
+        except Exception:
+            # The window is bounded regardless; the summary catches up on the next turn
+            return 0
+        with self._lock:
+            updated = self._conn.execute(
+                "UPDATE sessions SET summary = ?, summarized_through = ? "
+                "WHERE session_id = ? AND summarized_through = ?",
+                (new_summary, overflow[-1]["turn"], session_id, through),
+            ).rowcount
+            self._conn.commit()
+        if updated:
+            count("rag_session_turns_summarized_total", len(overflow))
+        return len(overflow) if updated else 0
+
+    def turn_count(self, session_id):
+        with self._lock:
+            row = self._conn.execute("SELECT COUNT(*) FROM turns WHERE session_id = ?", (session_id,)).fetchone()
+        return row[0]
+
+    def delete(self, session_id):
+        with self._lock:
+            deleted = self._conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,)).rowcount
+            deleted += self._conn.execute("DELETE FROM turns WHERE session_id = ?", (session_id,)).rowcount
+            self._conn.commit()
+        return deleted > 0
+
+
+def summarize_history(summary, turns, max_tokens=SESSION_SUMMARY_TOKENS):
+    """
+    Rolling summary: the previous summary updated with turns, clipped to max_tokens.
+    """
+    prompt = SUMMARY_PROMPT.format(words=max_tokens * 3 // 4, summary=summary or "(none)",
+                                   turns=_format_turns(turns))
+    with span("query", "summarize"):
+        response = get_chat_model().invoke(prompt)
+    return _clip(str(response.content).strip(), max_tokens)
+
+
+def rewrite_question(question, history):
+    """
+    Standalone version of a follow-up question. Returns question unchanged when
+    there is no history, rewriting is off or the model call fails.
+    """
+    if not history or not SESSION_REWRITE:
+        return question
+    try:
+        with span("query", "rewrite"):
+            response = get_chat_model().invoke(REWRITE_PROMPT.format(history=history, question=question))
+    except Exception:
+        return question
+    rewritten = str(response.content).strip()
+    return rewritten or question
+
+
+def prepare_turn(store, session_id, question):
+    """
+    Returns (history text, standalone question) for the next question in session_id.
+    """
+    summary, turns = store.window(session_id)
+    history = format_history(summary, turns)
+    return history, rewrite_question(question, history)
+
+
+def record_turn(store, session_id, question, answer, standalone=None):
+    store.append(session_id, question, answer, standalone)
+    store.compact(session_id)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_session_store():
+    # One connection per process, shared by the API and the Streamlit app
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = SessionStore()
+        return _store
@@ -1,8 +1,48 @@
 import streamlit as st
 import requests
 import base64
+import json
+import os
+import time
+import uuid
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
-API_URL = "http://127.0.0.1:8000"
+API_URL = os.getenv("API_URL", "http://127.0.0.1:8000")
+# (connect, read) seconds; the read timeout applies between streamed chunks too
+API_TIMEOUT = (5, float(os.getenv("API_READ_TIMEOUT", "300")))
+
+
+@st.cache_resource
+def get_session():
+    """
+    One pooled keep-alive session per Streamlit server, reused across reruns.
+    Only idempotent GETs are retried.
+    """
+    session = requests.Session()
+    retry = Retry(total=3, backoff_factor=0.3, status_forcelist=(502, 503, 504), allowed_methods=("GET",))
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=retry)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def sse_events(response):
+    """
+    Parses a Server-Sent Events response into (event, data) pairs.
+    """
+    event, data_lines = "message", []
+    for line in response.iter_lines(decode_unicode=True):
+        if line is None:
+            continue
+        if line == "":
+            if data_lines:
+                yield event, json.loads("\n".join(data_lines))
+            event, data_lines = "message", []
+        elif line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data_lines.append(line[len("data:"):].strip())
 
 st.set_page_config("Chat with Documents (API)")
 st.header("Chat with Documents using FastAPI Backend 💬")
@@ -12,24 +52,48 @@ if "file_id" not in st.session_state:
     st.session_state["file_id"] = None
 if "file_ids" not in st.session_state:
     st.session_state["file_ids"] = []
+if "file_names" not in st.session_state:
+    # file_id (content hash) -> original filename, for display
+    st.session_state["file_names"] = {}
+if "session_id" not in st.session_state:
+    # Conversation history is kept by the API under this id
+    st.session_state["session_id"] = uuid.uuid4().hex
 
 with st.sidebar:
     st.title("Menu:")
     uploaded_file = st.file_uploader("Upload your Document", type=["pdf", "docx", "txt", "jpg", "jpeg", "png", "csv", "db"])
 
     if st.button("Submit & Process") and uploaded_file:
-        with st.spinner("Uploading and processing..."):
+        with st.spinner("Uploading..."):
             files = {"file": (uploaded_file.name, uploaded_file.getbuffer())}
-            response = requests.post(f"{API_URL}/upload", files=files)
-            if response.status_code == 200:
-                file_id = response.json()["file_id"]
+            response = get_session().post(f"{API_URL}/upload", files=files, timeout=API_TIMEOUT)
+        if response.status_code in (200, 202):
+            upload = response.json()
+            file_id = upload["file_id"]
+            # Ingestion runs in the background; poll the job until the index is written
+            progress = st.progress(0.0, text="Queued...")
+            job = upload
+            while job["status"] not in ("done", "failed"):
+                time.sleep(0.5)
+                job = get_session().get(f"{API_URL}/jobs/{upload['job_id']}", timeout=API_TIMEOUT).json()
+                total = job.get("chunks_total") or 0
+                fraction = job.get("chunks_embedded", 0) / total if total else 0.0
+                progress.progress(min(fraction, 1.0), text=f"{job['status'].capitalize()}... "
+                                  f"pages: {job.get('pages_extracted', 0)}, chunks: {job.get('chunks_embedded', 0)}/{total}")
+            if job["status"] == "done":
                 st.session_state["file_id"] = file_id
                 # Track all uploaded file_ids for multi-doc querying
                 if file_id not in st.session_state["file_ids"]:
                     st.session_state["file_ids"].append(file_id)
-                st.success(f"Uploaded! file_id: {file_id}")
+                st.session_state["file_names"][file_id] = upload["filename"]
+                if upload.get("duplicate"):
+                    st.success(f"Already indexed: {upload['filename']} (file_id: {file_id})")
+                else:
+                    st.success(f"Uploaded! file_id: {file_id}")
             else:
-                st.error(f"Upload failed: {response.text}")
+                st.error(f"Processing failed: {job.get('error')}")
+        else:
+            st.error(f"Upload failed: {response.text}")
 
     # Multi-document selection
     if st.session_state["file_ids"]:
@@ -37,12 +101,16 @@ with st.sidebar:
         selected_files = st.multiselect(
             "Choose one or more files:",
             st.session_state["file_ids"],
-            default=st.session_state["file_ids"][:1]
+            default=st.session_state["file_ids"][:1],
+            format_func=lambda fid: st.session_state["file_names"].get(fid, fid)
         )
         st.session_state["selected_file_ids"] = selected_files
     else:
         st.session_state["selected_file_ids"] = []
 
+    if st.button("New conversation"):
+        st.session_state["session_id"] = uuid.uuid4().hex
+
 st.write("---")
 
 
@@ -57,18 +125,38 @@ if st.button("Ask") and user_question and st.session_state["selected_file_ids"]:
     payload = {
         "question": user_question,
         "file_id": ",".join(st.session_state["selected_file_ids"]),
-        "image_base64": image_base64
+        "image_base64": image_base64,
+        "session_id": st.session_state["session_id"],
     }
-    with st.spinner("Querying..."):
-        response = requests.post(f"{API_URL}/query", json=payload)
-        if response.status_code == 200:
-            data = response.json()
-            st.write("**Context:**")
-            st.code(data["context"])
-            st.write("**Answer:**")
-            st.success(data["answer"])
-            st.write("**Sources:**")
-            for meta in data.get("sources", []):
-                st.write(f"{meta.get('icon','')} `{meta.get('filename','')}` | Chunk: {meta.get('chunk','')} | Type: {meta.get('filetype','')}")
-        else:
-            st.error(f"Query failed: {response.text}")
+    # Stream the answer: sources arrive first, then tokens as the model produces them
+    with st.spinner("Searching documents..."):
+        response = get_session().post(f"{API_URL}/query/stream", json=payload, stream=True, timeout=API_TIMEOUT)
+    if response.status_code == 200:
+        events = sse_events(response)
+        for event, data in events:
+            if event == "sources":
+                if data.get("question") and data["question"] != user_question:
+                    st.caption(f"Searching for: {data['question']}")
+                st.write("**Context:**")
+                st.code(data["context"])
+                st.write("**Sources:**")
+                for meta in data.get("sources", []):
+                    rows = f" | Rows: {meta['row_start']}-{meta['row_end']}" if "row_start" in meta else ""
+                    table = f" | Table: {meta['table']}" if "table" in meta else ""
+                    st.write(f"{meta.get('icon','')} `{meta.get('filename','')}` | Chunk: {meta.get('chunk','')} | Type: {meta.get('filetype','')}{table}{rows}")
+                break
+        st.write("**Answer:**")
+
+        def answer_tokens():
+            for event, data in events:
+                if event == "token":
+                    yield data["text"]
+                elif event == "error":
+                    st.error(f"Query failed: {data.get('detail')}")
+                    return
+                elif event == "done":
+                    return
+
+        st.write_stream(answer_tokens())
+    else:
+        st.error(f"Query failed: {response.text}")
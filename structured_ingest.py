@@ -0,0 +1,143 @@
+# Streaming, row-batched ingestion for SQLite databases and CSV files
+import csv
+import os
+import sqlite3
+from collections import deque
+from urllib.request import pathname2url
+
+DB_FETCH_SIZE = 500
+
+
+def _quote_identifier(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _row_text(values):
+    return ", ".join("" if v is None else str(v) for v in values)
+
+
+class _RowGrouper:
+    """
+    Groups row lines into chunks of at most chunk_size (measured by length_function),
+    each starting with a header, and tracks the range of row numbers each chunk covers.
+    As in chunking.iter_chunks, each new chunk starts with the trailing rows of the
+    previous one, up to chunk_overlap.
+    """
+
+    def __init__(self, header, chunk_size, metadata, chunk_overlap=0, length_function=len):
+        self.header = header
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.length_function = length_function
+        self.metadata = metadata
+        self.sep_len = length_function("\n")
+        self.header_len = length_function(header)
+        self.rows = deque()  # (row_number, line, length)
+        self.size = self.header_len
+        self.fresh = 0  # rows added since the last group
+
+    def add(self, row_number, line):
+        line_len = self.length_function(line)
+        group = None
+        if self.rows and self.size + self.sep_len + line_len > self.chunk_size:
+            if self.fresh:
+                group = self._group()
+                self.fresh = 0
+            # Keep only the rows that fit in the overlap and leave room for this one
+            while self.rows and (self.size - self.header_len > self.chunk_overlap
+                                 or self.size + self.sep_len + line_len > self.chunk_size):
+                _, _, removed_len = self.rows.popleft()
+                self.size -= self.sep_len + removed_len
+        self.rows.append((row_number, line, line_len))
+        self.size += self.sep_len + line_len
+        self.fresh += 1
+        return group
+
+    def flush(self):
+        if not self.fresh:
+            return None
+        group = self._group()
+        self.rows.clear()
+        self.size = self.header_len
+        self.fresh = 0
+        return group
+
+    def _group(self):
+        text = self.header + "\n" + "\n".join(line for _, line, _ in self.rows)
+        return text, dict(self.metadata, row_start=self.rows[0][0], row_end=self.rows[-1][0])
+
+
+def iter_db_row_groups(file_path, chunk_size=1000, chunk_overlap=0, length_function=len,
+                       fetch_size=DB_FETCH_SIZE, progress=None):
+    """
+    Yields (text, metadata) row groups for every table of a SQLite database.
+    Rows are streamed with fetchmany, so memory stays bounded by fetch_size and
+    chunk_size. metadata holds table, columns, row_start and row_end (1-based).
+    progress(table, rows_done) is called after each fetched batch.
+    """
+    # Quoted, so "?", "#" and "%" in the path are not read as URI syntax
+    conn = sqlite3.connect(f"file:{pathname2url(os.path.abspath(file_path))}?mode=ro", uri=True)
+    try:
+        tables = [
+            row[0] for row in conn.execute(
+                "SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%' ORDER BY name"
+            )
+        ]
+        for table_name in tables:
+            cursor = conn.execute(f"SELECT * FROM {_quote_identifier(table_name)}")
+            columns = [d[0] for d in cursor.description]
+            grouper = _RowGrouper(
+                f"Table: {table_name}\nColumns: {', '.join(columns)}",
+                chunk_size,
+                {"table": table_name, "columns": ", ".join(columns)},
+                chunk_overlap,
+                length_function,
+            )
+            rows_done = 0
+            while True:
+                rows = cursor.fetchmany(fetch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    rows_done += 1
+                    group = grouper.add(rows_done, _row_text(row))
+                    if group:
+                        yield group
+                if progress:
+                    progress(table_name, rows_done)
+            group = grouper.flush()
+            if group:
+                yield group
+            cursor.close()
+    finally:
+        conn.close()
+
+
+def iter_csv_row_groups(file_path, chunk_size=1000, chunk_overlap=0, length_function=len, progress=None,
+                        progress_every=10000):
+    """
+    Yields (text, metadata) row groups from a CSV file, streamed with the csv module.
+    Every chunk repeats the header line; metadata holds columns, row_start and row_end.
+    """
+    with open(file_path, newline='', encoding='utf-8') as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if header is None:
+            return
+        grouper = _RowGrouper(",".join(header), chunk_size, {"columns": ", ".join(header)}, chunk_overlap,
+                              length_function)
+        rows_done = 0
+        for row in reader:
+            if not any(cell.strip() for cell in row):
+                continue
+            rows_done += 1
+            group = grouper.add(rows_done, ",".join(row))
+            if group:
+                yield group
+            if progress and rows_done % progress_every == 0:
+                progress(None, rows_done)
+        group = grouper.flush()
+        if group:
+            yield group
+        if progress:
+            progress(None, rows_done)
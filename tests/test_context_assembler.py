@@ -0,0 +1,34 @@
+from langchain_core.documents import Document
+
+from context_assembler import merge_adjacent
+from pdf_chunk_helper import _chunk_page
+
+
+def _docs(*texts, filename="policy.pdf", page=1):
+    return [Document(page_content=t, metadata={"filename": filename, "page": page, "chunk": i})
+            for i, t in enumerate(texts)]
+
+
+def test_chunker_overlap_is_written_once():
+    shared = "Leave must be approved by the supervisor."
+    merged = merge_adjacent(_docs("Section 4. " + shared, shared + " Sick leave needs a note."))
+    assert merged[0].page_content == "Section 4. " + shared + " Sick leave needs a note."
+
+
+def test_pdf_character_window_overlap_is_written_once():
+    # pdf_chunk_helper cuts at raw offsets, so overlaps start and end mid-word
+    text = " ".join(f"The Territory's Budget Act section {i} applies to grant {i * 7}." for i in range(20))
+    chunks = _chunk_page(text, 1, 200, 100)
+    merged = merge_adjacent(_docs(*[chunk for chunk, _ in chunks]))
+    assert len(merged) == 1
+    assert merged[0].page_content == text
+
+
+def test_coincidental_match_is_not_spliced():
+    merged = merge_adjacent(_docs("The supervisor shall sign the", "external examiner report"))
+    assert merged[0].page_content == "The supervisor shall sign the\nexternal examiner report"
+
+
+def test_csv_rows_are_not_spliced():
+    merged = merge_adjacent(_docs("grades.csv: id, amount: 12", "2,2000.06,paid", filename="grades.csv", page=None))
+    assert merged[0].page_content == "grades.csv: id, amount: 12\n2,2000.06,paid"
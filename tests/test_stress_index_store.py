@@ -0,0 +1,32 @@
+import multiprocessing
+
+from benchmarks.stress_index_store import check_consistent, expected_documents, reader, writer
+from index_registry import IndexRegistry
+from local_models import HashEmbeddings
+
+WRITERS, READERS, ROUNDS = 2, 2, 6
+
+
+def test_writer_and_reader_processes_share_one_index(tmp_path):
+    # A small run of benchmarks/stress_index_store.py: no lost updates, no torn reads
+    index_path = str(tmp_path / "index")
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    stop = context.Event()
+    readers = [context.Process(target=reader, args=(index_path, i, stop, results)) for i in range(READERS)]
+    writers = [context.Process(target=writer, args=(index_path, i, ROUNDS, results)) for i in range(WRITERS)]
+    for process in readers + writers:
+        process.start()
+    for process in writers:
+        process.join(120)
+    stop.set()
+    reports = [results.get(timeout=60) for _ in range(READERS + WRITERS)]
+    for process in readers:
+        process.join(60)
+
+    assert [process.exitcode for process in readers + writers] == [0] * (READERS + WRITERS)
+    for report in reports:
+        assert report[4] == [], f"{report[0]} {report[1]}: {report[4][:3]}"
+    problems, documents = check_consistent(IndexRegistry().get(index_path, HashEmbeddings()))
+    assert problems == []
+    assert documents == expected_documents(WRITERS, ROUNDS)
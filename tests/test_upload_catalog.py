@@ -0,0 +1,19 @@
+from upload_catalog import UploadCatalog, file_id_for, is_file_id
+
+
+def test_file_ids_are_32_hex_digits():
+    assert is_file_id(file_id_for("ab" * 32))
+    for value in (".", "..", "_corpus", "../faiss_index", "AB" * 16, "a" * 31, "", None):
+        assert not is_file_id(value)
+
+
+def test_catalogs_sharing_a_file_keep_each_others_entries(tmp_path):
+    # Two uvicorn workers each hold their own UploadCatalog on the same file
+    path = str(tmp_path / "catalog.json")
+    first, second = UploadCatalog(path), UploadCatalog(path)
+    a = first.register("a.pdf", "a" * 64, 1)
+    b = second.register("b.pdf", "b" * 64, 2)
+    first.register("c.pdf", "c" * 64, 3)
+    assert {e["file_id"] for e in second.entries()} == {a, b, file_id_for("c" * 64)}
+    assert second.remove(a) and not first.remove(a)
+    assert {e["file_id"] for e in first.entries()} == {b, file_id_for("c" * 64)}
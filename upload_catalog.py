@@ -0,0 +1,126 @@
+# Content-addressed uploads: streaming hash + size limit, and a filename -> file_id catalog
+import fcntl
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(200 * 1024 * 1024)))
+UPLOAD_READ_SIZE = 1024 * 1024
+# Hex digits of the SHA-256 used as file_id
+FILE_ID_LENGTH = 32
+_FILE_ID_RE = re.compile(f"[0-9a-f]{{{FILE_ID_LENGTH}}}")
+
+
+class UploadTooLargeError(Exception):
+    pass
+
+
+def file_id_for(digest):
+    return digest[:FILE_ID_LENGTH]
+
+
+def is_file_id(value):
+    # file_ids are joined into index paths, so anything else ("." , "..", "a/b") is rejected
+    return bool(value) and _FILE_ID_RE.fullmatch(value) is not None
+
+
+async def save_upload(upload_file, upload_dir, max_bytes=MAX_UPLOAD_BYTES):
+    """
+    Streams an UploadFile to a unique temp file in upload_dir while hashing it.
+    Returns (temp_path, sha256 hex digest, size). Raises UploadTooLargeError
+    (and removes the partial file) once more than max_bytes have been read.
+    """
+    os.makedirs(upload_dir, exist_ok=True)
+    ext = os.path.splitext(upload_file.filename or "")[1].lower()
+    fd, temp_path = tempfile.mkstemp(dir=upload_dir, suffix=ext)
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                block = await upload_file.read(UPLOAD_READ_SIZE)
+                if not block:
+                    break
+                size += len(block)
+                if size > max_bytes:
+                    raise UploadTooLargeError(f"Upload exceeds the {max_bytes} byte limit.")
+                digest.update(block)
+                out.write(block)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+    return temp_path, digest.hexdigest(), size
+
+
+class UploadCatalog:
+    """
+    Small JSON catalog of uploaded content: file_id -> {sha256, size, filenames}
+    plus filename -> latest file_id. Every change re-reads the file under an
+    exclusive fcntl lock (path + ".lock"), so uvicorn workers do not overwrite
+    each other's entries. Writes are atomic (temp file + rename).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def _read(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {"files": {}, "names": {}}
+
+    def _write(self, data):
+        tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, self.path)
+
+    @contextmanager
+    def _edit(self):
+        # Yields the catalog as it is on disk now; changes made in the block are written back
+        with self._lock:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with open(f"{self.path}.lock", "a") as lock_file:
+                # Closing the file releases the lock
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                data = self._read()
+                yield data
+                self._write(data)
+
+    def register(self, filename, digest, size):
+        """
+        Records that filename has content digest and returns its file_id.
+        """
+        file_id = file_id_for(digest)
+        with self._edit() as data:
+            entry = data["files"].setdefault(
+                file_id, {"sha256": digest, "size": size, "filenames": [], "created": time.time()}
+            )
+            if filename not in entry["filenames"]:
+                entry["filenames"].append(filename)
+            data["names"][filename] = file_id
+        return file_id
+
+    def remove(self, file_id):
+        with self._edit() as data:
+            entry = data["files"].pop(file_id, None)
+            if entry is None:
+                return False
+            for name in entry["filenames"]:
+                if data["names"].get(name) == file_id:
+                    del data["names"][name]
+        return True
+
+    def entries(self):
+        # Readers need no lock: the file is only ever replaced whole
+        return [dict(entry, file_id=file_id) for file_id, entry in self._read()["files"].items()]